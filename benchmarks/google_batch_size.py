@@ -0,0 +1,124 @@
+"""Benchmark of the output shard size of google vision against a local GCS emulator.
+
+The vision job itself can't be emulated, this measures what happens after it:
+listing the output shards of a pdf, downloading and parsing them. Synthetic
+shards are uploaded for every batch size and read with `read_shards`, as
+`GoogleOcr` does.
+
+Start the emulator and run the benchmark from the root of the repository:
+
+    docker run -d -p 4443:4443 fsouza/fake-gcs-server -scheme http
+    python benchmarks/google_batch_size.py --pages 500 --batch-sizes 1,2,10,63,100
+"""
+
+# Standart python libraries
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 3rd party libraries
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import storage
+
+# Own
+from ocr.async_utils import run_sync
+from ocr.google_ocr import auto_batch_size, read_shards
+
+
+def synthetic_page(page, words):
+    """Json response of a page with `words` words, like the ones of vision."""
+    items = []
+    for k in range(words):
+        x, y = (k % 12) / 12, (k // 12) / (words / 12 + 1)
+        items.append(
+            {
+                "confidence": 0.98,
+                "boundingBox": {
+                    "normalizedVertices": [
+                        {"x": x, "y": y},
+                        {"x": x + 0.07, "y": y},
+                        {"x": x + 0.07, "y": y + 0.01},
+                        {"x": x, "y": y + 0.01},
+                    ]
+                },
+                "symbols": [{"text": c} for c in f"word{k}"],
+            }
+        )
+    text = " ".join(f"word{k}" for k in range(words))
+    return {
+        "context": {"pageNumber": page},
+        "fullTextAnnotation": {
+            "text": text,
+            "pages": [{"blocks": [{"paragraphs": [{"words": items}]}]}],
+        },
+    }
+
+
+def upload_shards(bucket, prefix, pages, words, batch_size):
+    for first in range(1, pages + 1, batch_size):
+        last = min(first + batch_size - 1, pages)
+        shard = {
+            "responses": [
+                synthetic_page(page, words) for page in range(first, last + 1)
+            ]
+        }
+        blob = bucket.blob(f"{prefix}output-{first}-to-{last}.json")
+        blob.upload_from_string(json.dumps(shard), content_type="application/json")
+
+
+def read_document(bucket, prefix, compact, max_downloads):
+    blobs = list(bucket.list_blobs(prefix=prefix))
+    pages_text, _ = run_sync(read_shards(blobs, compact, max_downloads))
+    return len(blobs), len(pages_text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--emulator", default="http://localhost:4443")
+    parser.add_argument("--bucket", default="ocr-benchmark")
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--words", type=int, default=300, help="words per page")
+    parser.add_argument("--batch-sizes", default="1,2,5,10,20,50,100")
+    parser.add_argument("--max-downloads", type=int, default=8)
+    parser.add_argument("--compact", action="store_true")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ["STORAGE_EMULATOR_HOST"] = args.emulator
+    client = storage.Client(project="benchmark", credentials=AnonymousCredentials())
+    bucket = client.lookup_bucket(args.bucket) or client.create_bucket(args.bucket)
+
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+    auto = auto_batch_size(args.pages, args.max_downloads)
+    if auto not in batch_sizes:
+        batch_sizes.append(auto)
+
+    print(f"{args.pages} pages, {args.words} words per page, auto batch size {auto}")
+    print(f"{'batch size':>10} {'shards':>7} {'median s':>9} {'min s':>7}")
+    for batch_size in sorted(batch_sizes):
+        prefix = f"{args.pages}-{args.words}/{batch_size}/"
+        if next(iter(bucket.list_blobs(prefix=prefix, max_results=1)), None) is None:
+            upload_shards(bucket, prefix, args.pages, args.words, batch_size)
+
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            shards, pages = read_document(
+                bucket, prefix, args.compact, args.max_downloads
+            )
+            times.append(time.perf_counter() - start)
+            assert pages == args.pages
+
+        print(
+            f"{batch_size:>10} {shards:>7} {statistics.median(times):>9.3f}"
+            f" {min(times):>7.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
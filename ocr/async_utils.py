@@ -0,0 +1,56 @@
+"""Helpers to run the blocking cloud clients from asyncio code and back.
+
+>>> text = await run_blocking(parser.from_file, file_path)
+>>> run_sync(doc.apipeline_extraction())
+"""
+
+# Standart python libraries
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+async def run_blocking(function, *args, **kwargs):
+    """Run a blocking function in the default executor of the running loop.
+
+    Parameters
+    ----------
+    function : function
+        blocking function (boto3, google cloud or tika calls)
+    args, kwargs
+        arguments of the function
+
+    Returns
+    -------
+    object
+        value returned by the function
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, functools.partial(function, *args, **kwargs)
+    )
+
+
+def run_sync(coroutine):
+    """Run a coroutine to completion from synchronous code.
+
+    If the calling thread already runs an event loop (a notebook for example) the
+    coroutine is run in a new loop in a helper thread.
+
+    Parameters
+    ----------
+    coroutine : coroutine
+        coroutine to run
+
+    Returns
+    -------
+    object
+        value returned by the coroutine
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
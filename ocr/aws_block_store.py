@@ -0,0 +1,361 @@
+"""Compact, array backed storage of textract blocks.
+
+A textract block is a dict with a UUID string id, nested geometry dicts and
+relationship lists, one document can have hundreds of thousands of them. The
+`BlockStore` keeps every attribute of the blocks in a column instead: block types
+are interned in a small table, ids are the row number of the block, geometry and
+confidences are NumPy arrays and the CHILD and VALUE relationships are stored in
+CSR form (`indptr`, `indices`) like a sparse matrix.
+
+>>> store = BlockStore()
+>>> for block in response["Blocks"]:
+...     store.add(block)
+>>> store.finalize()
+>>> [store.text(child) for child in store.children(0)]
+"""
+
+# Standart python libraries
+from array import array
+from collections.abc import Sequence
+
+# 3rd party libraries
+import numpy as np
+
+entity_types = (None, "KEY", "VALUE")
+selection_statuses = (None, "SELECTED", "NOT_SELECTED")
+
+
+class BlockStore:
+    """Columnar storage of textract blocks.
+
+    Blocks are appended with `add` in any order, relationships may point to blocks
+    that haven't been added yet. Once every block is added `finalize` converts the
+    columns to NumPy arrays and resolves the relationships, the UUIDs are
+    discarded at that point.
+
+    Attributes
+    ----------
+    block_types : list
+        interned block types, the type code of a block is its position in the list
+    types : numpy.ndarray
+        type code of each block (uint8)
+    pages : numpy.ndarray
+        page of each block (int32, 1 when textract doesn't give it)
+    confidences : numpy.ndarray
+        confidence of each block (float32, NaN when textract doesn't give it)
+    boxes : numpy.ndarray
+        (n, 4) float32 array with the Left, Top, Width and Height of each block
+    entities : numpy.ndarray
+        index in `entity_types` of the KEY_VALUE_SET blocks (uint8)
+    cells : numpy.ndarray
+        (n, 4) int32 array with RowIndex, ColumnIndex, RowSpan and ColumnSpan
+    selections : numpy.ndarray
+        index in `selection_statuses` of the SELECTION_ELEMENT blocks (uint8)
+    child_indptr, child_indices : numpy.ndarray
+        CHILD relationships in CSR form
+    value_indptr, value_indices : numpy.ndarray
+        VALUE relationships in CSR form
+    """
+
+    def __init__(self):
+        self.block_types = []
+        self._type_codes = {}
+
+        self._ids = {}
+        self._types = array("B")
+        self._pages = array("i")
+        self._confidences = array("f")
+        self._boxes = array("f")
+        self._entities = array("B")
+        self._cells = array("i")
+        self._selections = array("B")
+        self._texts = []
+        self._children = []
+        self._values = []
+
+        self.finalized = False
+
+    def __len__(self):
+        return len(self._types) if not self.finalized else len(self.types)
+
+    def type_code(self, block_type):
+        """Return the interned code of `block_type` (-1 if there isn't any block)."""
+        return self._type_codes.get(block_type, -1)
+
+    def add(self, block):
+        """Append a textract block to the store.
+
+        Parameters
+        ----------
+        block : dict
+            textract block
+
+        Returns
+        -------
+        int
+            id of the block in the store
+        """
+        if self.finalized:
+            raise Exception("Blocks can't be added to a finalized BlockStore")
+
+        index = len(self._types)
+        self._ids[block["Id"]] = index
+
+        block_type = block["BlockType"]
+        if block_type not in self._type_codes:
+            self._type_codes[block_type] = len(self.block_types)
+            self.block_types.append(block_type)
+        self._types.append(self._type_codes[block_type])
+
+        self._pages.append(block.get("Page", 1))
+        self._confidences.append(block.get("Confidence", float("nan")))
+
+        box = block.get("Geometry", {}).get("BoundingBox")
+        if box is None:
+            self._boxes.extend((np.nan, np.nan, np.nan, np.nan))
+        else:
+            self._boxes.extend((box["Left"], box["Top"], box["Width"], box["Height"]))
+
+        entities = block.get("EntityTypes", ())
+        self._entities.append(
+            1 if "KEY" in entities else 2 if "VALUE" in entities else 0
+        )
+        self._cells.extend(
+            (
+                block.get("RowIndex", 0),
+                block.get("ColumnIndex", 0),
+                block.get("RowSpan", 0),
+                block.get("ColumnSpan", 0),
+            )
+        )
+        self._selections.append(
+            selection_statuses.index(block["SelectionStatus"])
+            if "SelectionStatus" in block
+            else 0
+        )
+        self._texts.append(block.get("Text", ""))
+
+        children, values = None, None
+        for relationship in block.get("Relationships", ()):
+            if relationship["Type"] == "CHILD":
+                children = (children or []) + relationship["Ids"]
+            elif relationship["Type"] == "VALUE":
+                values = (values or []) + relationship["Ids"]
+        self._children.append(children)
+        self._values.append(values)
+
+        return index
+
+    def finalize(self):
+        """Convert the columns to arrays and resolve the relationships."""
+        if self.finalized:
+            return
+
+        self.types = np.frombuffer(self._types, dtype=np.uint8).copy()
+        self.pages = np.frombuffer(self._pages, dtype=np.int32).copy()
+        self.confidences = np.frombuffer(self._confidences, dtype=np.float32).copy()
+        self.boxes = np.frombuffer(self._boxes, dtype=np.float32).reshape(-1, 4).copy()
+        self.entities = np.frombuffer(self._entities, dtype=np.uint8).copy()
+        self.cells = np.frombuffer(self._cells, dtype=np.int32).reshape(-1, 4).copy()
+        self.selections = np.frombuffer(self._selections, dtype=np.uint8).copy()
+
+        lengths = np.fromiter((len(text) for text in self._texts), dtype=np.int64)
+        self.text_offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.text_offsets[1:])
+        self.text_data = "".join(self._texts)
+
+        self.child_indptr, self.child_indices = self._to_csr(self._children)
+        self.value_indptr, self.value_indices = self._to_csr(self._values)
+
+        self._ids = None
+        self._types = self._pages = self._confidences = self._boxes = None
+        self._entities = self._cells = self._selections = None
+        self._texts = self._children = self._values = None
+        self.finalized = True
+
+    def _to_csr(self, relationships):
+        indptr = np.zeros(len(relationships) + 1, dtype=np.int64)
+        indices = array("i")
+        for k, uuids in enumerate(relationships):
+            if uuids:
+                indices.extend(self._ids[uuid] for uuid in uuids)
+            indptr[k + 1] = len(indices)
+        return indptr, np.frombuffer(indices, dtype=np.int32).copy()
+
+    def take(self, indices, page=None):
+        """Return a new finalized store with only some of the blocks.
+
+        Relationships to blocks that aren't taken are dropped, the blocks get new
+        ids following the order of `indices`.
+
+        Parameters
+        ----------
+        indices : list
+            ids of the blocks to keep
+        page : int, optional
+            page number given to every block, by default they keep their page
+
+        Returns
+        -------
+        BlockStore
+            store with the blocks
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        new_ids = np.full(len(self.types), -1, dtype=np.int64)
+        new_ids[indices] = np.arange(len(indices))
+
+        store = BlockStore()
+        store.block_types = list(self.block_types)
+        store._type_codes = dict(self._type_codes)
+
+        store.types = self.types[indices]
+        store.pages = (
+            self.pages[indices]
+            if page is None
+            else np.full(len(indices), page, dtype=np.int32)
+        )
+        store.confidences = self.confidences[indices]
+        store.boxes = self.boxes[indices]
+        store.entities = self.entities[indices]
+        store.cells = self.cells[indices]
+        store.selections = self.selections[indices]
+
+        texts = [self.text(k) for k in indices]
+        lengths = np.fromiter((len(text) for text in texts), dtype=np.int64)
+        store.text_offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=store.text_offsets[1:])
+        store.text_data = "".join(texts)
+
+        for kind, rows in (("child", self.children), ("value", self.values)):
+            indptr = np.zeros(len(indices) + 1, dtype=np.int64)
+            related = [np.zeros(0, dtype=np.int64)]
+            for k, index in enumerate(indices):
+                ids = new_ids[rows(index)]
+                related.append(ids[ids >= 0])
+                indptr[k + 1] = indptr[k] + len(related[-1])
+            setattr(store, f"{kind}_indptr", indptr)
+            setattr(store, f"{kind}_indices", np.concatenate(related).astype(np.int32))
+
+        store._ids = None
+        store._types = store._pages = store._confidences = store._boxes = None
+        store._entities = store._cells = store._selections = None
+        store._texts = store._children = store._values = None
+        store.finalized = True
+        return store
+
+    def ids_of_type(self, block_type):
+        """Return the ids of the blocks of type `block_type` in insertion order."""
+        return np.flatnonzero(self.types == self.type_code(block_type))
+
+    def block_type(self, index):
+        return self.block_types[self.types[index]]
+
+    def text(self, index):
+        return self.text_data[self.text_offsets[index] : self.text_offsets[index + 1]]
+
+    def children(self, index):
+        start, end = self.child_indptr[index], self.child_indptr[index + 1]
+        return self.child_indices[start:end]
+
+    def values(self, index):
+        start, end = self.value_indptr[index], self.value_indptr[index + 1]
+        return self.value_indices[start:end]
+
+    def is_selected(self, index):
+        return self.selections[index] == 1
+
+    def to_dict(self, index):
+        """Rebuild a textract-like block dict (ids are the integer ids of the store).
+
+        Parameters
+        ----------
+        index : int
+            id of the block
+
+        Returns
+        -------
+        dict
+            block with the attributes kept by the store
+        """
+        index = int(index)
+        block = {"BlockType": self.block_type(index), "Id": index}
+        block["Page"] = int(self.pages[index])
+        if not np.isnan(self.confidences[index]):
+            block["Confidence"] = float(self.confidences[index])
+        if self.text_offsets[index] != self.text_offsets[index + 1]:
+            block["Text"] = self.text(index)
+        if not np.isnan(self.boxes[index, 0]):
+            left, top, width, height = (float(x) for x in self.boxes[index])
+            block["Geometry"] = {
+                "BoundingBox": {
+                    "Left": left,
+                    "Top": top,
+                    "Width": width,
+                    "Height": height,
+                }
+            }
+        if self.entities[index]:
+            block["EntityTypes"] = [entity_types[self.entities[index]]]
+        if self.cells[index, 0]:
+            row, column, row_span, column_span = (int(x) for x in self.cells[index])
+            block.update(
+                RowIndex=row,
+                ColumnIndex=column,
+                RowSpan=row_span,
+                ColumnSpan=column_span,
+            )
+        if self.selections[index]:
+            block["SelectionStatus"] = selection_statuses[self.selections[index]]
+
+        relationships = []
+        children, values = self.children(index), self.values(index)
+        for kind, ids in (("CHILD", children), ("VALUE", values)):
+            if len(ids):
+                relationships.append({"Type": kind, "Ids": ids.tolist()})
+        if relationships:
+            block["Relationships"] = relationships
+        return block
+
+
+class BlockList(Sequence):
+    """Read-only list of blocks of a `BlockStore` that builds the dicts on access.
+
+    Parameters
+    ----------
+    store : BlockStore
+        store that owns the blocks
+    indices : numpy.ndarray
+        ids of the blocks in the list
+    """
+
+    __slots__ = ("store", "indices")
+
+    def __init__(self, store, indices):
+        self.store = store
+        self.indices = np.asarray(indices, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return BlockList(self.store, self.indices[k])
+        return self.store.to_dict(self.indices[k])
+
+    def compact(self, page=None):
+        """Return the same blocks in a list that owns a store with only them.
+
+        Useful to keep or pickle a single page without the rest of the document.
+
+        Parameters
+        ----------
+        page : int, optional
+            new page number of the blocks, by default they keep their page
+
+        Returns
+        -------
+        BlockList
+            list over a new store
+        """
+        store = self.store.take(self.indices, page)
+        return BlockList(store, np.arange(len(self.indices)))
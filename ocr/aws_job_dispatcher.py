@@ -0,0 +1,334 @@
+"""Dispatcher that waits for Textract job completion notifications published in SQS.
+
+Textract publishes a message in an SNS topic when an asynchronous job finishes,
+the topic is subscribed by an SQS queue. Only one dispatcher per queue lives in
+the process, it long-polls the queue while there are jobs waiting and routes
+every notification to the job with the same JobId.
+
+Failures are kept to the job they belong to: errors receiving messages are
+retried with backoff, messages that can't be parsed are deleted and only the
+notification of a job finishes it. Notifications nobody is waiting for anymore
+(their waiter timed out here, or they've been in the queue longer than
+`orphan_age`) are deleted instead of going round the queue forever.
+
+>>> dispatcher = get_dispatcher(sqs, queue_url)
+>>> dispatcher.register(job_id)
+>>> status = dispatcher.wait(job_id)
+>>> status = await dispatcher.wait_async(job_id)
+"""
+
+# Standart python libraries
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Seconds a message of another process is hidden before it's visible again
+foreign_visibility = 5
+# Seconds after which a notification nobody took is considered orphaned
+orphan_age = 900
+# Maximum seconds between polls after errors or polls with only foreign messages
+max_backoff = 5
+# JobIds whose waiters gave up that are remembered to delete their notifications
+max_abandoned = 10000
+
+_dispatchers = {}
+_dispatchers_lock = threading.Lock()
+
+
+def get_dispatcher(sqs, queue_url, wait_time=20):
+    """Return the process-wide dispatcher of `queue_url`, creating it if needed.
+
+    Parameters
+    ----------
+    sqs : boto3.client
+        sqs client (or any object with the same `receive_message`, `delete_message`
+        and `change_message_visibility` methods), only used the first time
+    queue_url : str
+        url of the queue subscribed to the Textract SNS topic
+    wait_time : int, optional
+        seconds of each long poll (max 20), by default 20
+
+    Returns
+    -------
+    TextractJobDispatcher
+        dispatcher associated to the queue
+    """
+    with _dispatchers_lock:
+        if queue_url not in _dispatchers:
+            _dispatchers[queue_url] = TextractJobDispatcher(sqs, queue_url, wait_time)
+        return _dispatchers[queue_url]
+
+
+class _Job:
+    __slots__ = ("event", "status", "error", "callbacks", "lock")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.status = None
+        self.error = None
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    def add_done_callback(self, callback):
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return
+        callback()
+
+    def finish(self, status=None, error=None):
+        with self.lock:
+            self.status = status
+            self.error = error
+            self.event.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+class TextractJobDispatcher:
+    """Route Textract completion notifications from one SQS queue to waiting jobs.
+
+    A single background thread long-polls the queue while at least one job is
+    registered and stops as soon as nobody is waiting, so no api calls are made
+    when the process is idle. Messages that belong to jobs of other processes are
+    made visible again after `foreign_visibility` seconds instead of being held
+    until their visibility timeout expires, and the next poll is delayed while
+    only those messages arrive so they aren't received again in a tight loop.
+
+    Parameters
+    ----------
+    sqs : boto3.client
+        sqs client
+    queue_url : str
+        url of the queue subscribed to the Textract SNS topic
+    wait_time : int, optional
+        seconds of each long poll (max 20), by default 20
+
+    Attributes
+    ----------
+    jobs : dict
+        JobId -> job state of the jobs currently waiting
+    """
+
+    def __init__(self, sqs, queue_url, wait_time=20):
+        self.sqs = sqs
+        self.queue_url = queue_url
+        self.wait_time = wait_time
+
+        self.jobs = {}
+        self._abandoned = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._backoff = 0
+
+    def register(self, job_id):
+        """Start listening for the notification of `job_id`.
+
+        Call it as soon as the job is started, several jobs can be registered and
+        waited at the same time from different threads.
+
+        Parameters
+        ----------
+        job_id : str
+            JobId returned by `start_document_analysis` or
+            `start_document_text_detection`
+
+        Returns
+        -------
+        _Job
+            state of the job, the event is set once the notification arrives
+        """
+        with self._lock:
+            job = self.jobs.setdefault(job_id, _Job())
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._poll_forever, name="textract-dispatcher", daemon=True
+                )
+                self._thread.start()
+        return job
+
+    def wait(self, job_id, timeout=None):
+        """Block until the notification of `job_id` arrives.
+
+        Parameters
+        ----------
+        job_id : str
+            JobId of the job
+        timeout : float, optional
+            maximum seconds to wait, by default None (wait forever)
+
+        Returns
+        -------
+        str
+            status of the job ("SUCCEEDED", "FAILED", "ERROR")
+
+        Raises
+        ------
+        TimeoutError
+            if the notification didn't arrive in `timeout` seconds
+        """
+        job = self.register(job_id)
+
+        finished = job.event.wait(timeout)
+        self._forget(job_id, finished)
+
+        if not finished:
+            raise TimeoutError(f"Textract job {job_id} didn't finish in {timeout}s")
+        if job.error is not None:
+            raise job.error
+        return job.status
+
+    async def wait_async(self, job_id, timeout=None):
+        """Wait for the notification of `job_id` without blocking the event loop.
+
+        No thread is used per job, the polling thread of the dispatcher wakes up
+        the coroutine when the notification arrives.
+
+        Parameters
+        ----------
+        job_id : str
+            JobId of the job
+        timeout : float, optional
+            maximum seconds to wait, by default None (wait forever)
+
+        Returns
+        -------
+        str
+            status of the job ("SUCCEEDED", "FAILED", "ERROR")
+
+        Raises
+        ------
+        TimeoutError
+            if the notification didn't arrive in `timeout` seconds
+        """
+        loop = asyncio.get_running_loop()
+        finished = loop.create_future()
+
+        def wake_up():
+            if not finished.done():
+                finished.set_result(None)
+
+        job = self.register(job_id)
+        job.add_done_callback(lambda: loop.call_soon_threadsafe(wake_up))
+
+        try:
+            await asyncio.wait_for(finished, timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Textract job {job_id} didn't finish in {timeout}s")
+        finally:
+            self._forget(job_id, job.event.is_set())
+
+        if job.error is not None:
+            raise job.error
+        return job.status
+
+    def _forget(self, job_id, finished):
+        """Stop waiting for `job_id`, if it didn't finish its notification will
+        be deleted when it arrives."""
+        with self._lock:
+            self.jobs.pop(job_id, None)
+            if not finished:
+                self._abandoned[job_id] = None
+                if len(self._abandoned) > max_abandoned:
+                    self._abandoned.popitem(last=False)
+
+    def _poll_forever(self):
+        while True:
+            with self._lock:
+                if not self.jobs:
+                    self._thread = None
+                    return
+            if self._backoff:
+                time.sleep(self._backoff)
+            try:
+                handled = self._poll()
+            except Exception as error:
+                print(f"Error receiving Textract notifications, retrying: {error}")
+                handled = False
+
+            if handled is False:
+                # Errors and messages of other processes only: wait before polling
+                self._backoff = min(max(2 * self._backoff, 0.25), max_backoff)
+            else:
+                self._backoff = 0
+
+    def _poll(self):
+        """Receive and route one batch of messages.
+
+        Returns
+        -------
+        bool or None
+            None if no message was received, else if any message was handled
+            by this process (not only released for another process)
+        """
+        sqs_response = self.sqs.receive_message(
+            QueueUrl=self.queue_url,
+            AttributeNames=["SentTimestamp"],
+            MessageAttributeNames=["All"],
+            MaxNumberOfMessages=10,
+            WaitTimeSeconds=self.wait_time,
+        )
+        messages = sqs_response.get("Messages", [])
+        if not messages:
+            return None
+        handled = [self._dispatch(message) for message in messages]
+        return any(handled)
+
+    def _dispatch(self, message):
+        """Route a message to its job.
+
+        Returns
+        -------
+        bool
+            False if the message belongs to another process and was released
+        """
+        try:
+            notification = json.loads(message["Body"])
+            text_message = json.loads(notification["Message"])
+            job_id = str(text_message["JobId"])
+        except (ValueError, KeyError, TypeError):
+            # Not a Textract notification (e.g. a SubscriptionConfirmation)
+            self._delete(message)
+            return True
+
+        with self._lock:
+            job = self.jobs.get(job_id)
+            abandoned = job_id in self._abandoned
+            self._abandoned.pop(job_id, None)
+
+        if job is not None:
+            self._delete(message)
+            job.finish(status=text_message.get("Status"))
+            return True
+
+        if abandoned or self._is_orphan(message):
+            self._delete(message)
+            return True
+
+        # The job belongs to another worker, give the message back
+        try:
+            self.sqs.change_message_visibility(
+                QueueUrl=self.queue_url,
+                ReceiptHandle=message["ReceiptHandle"],
+                VisibilityTimeout=foreign_visibility,
+            )
+        except Exception as error:
+            print(f"Couldn't release Textract notification of job {job_id}: {error}")
+        return False
+
+    def _is_orphan(self, message):
+        sent = message.get("Attributes", {}).get("SentTimestamp")
+        return sent is not None and time.time() - int(sent) / 1000 > orphan_age
+
+    def _delete(self, message):
+        try:
+            self.sqs.delete_message(
+                QueueUrl=self.queue_url, ReceiptHandle=message["ReceiptHandle"]
+            )
+        except Exception as error:
+            # The message comes back after its visibility timeout and is
+            # deleted then
+            print(f"Couldn't delete Textract notification: {error}")
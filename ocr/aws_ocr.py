@@ -6,20 +6,38 @@
 """
 
 # Standart python libraries
-import json
-import copy
-import sys
-import time
+import asyncio
+import os
+import random
+import uuid
 
 # 3rd party libraries
-import boto3
-import pandas as pd
+from botocore.exceptions import ClientError
 
 # Own
+from .async_utils import run_blocking, run_sync
+from .aws_job_dispatcher import get_dispatcher
 from .aws_response_formatter import ResponseFormatter
+from .aws_result_reader import TextractResultReader
+from .clients import get_aws_client
 from .ocr_document import Document
+from .table import as_table, tables_to_xlsx
 
 admitted_extensions = ["pdf", "jpg", "jpeg", "png"]
+textract_queue_url = "https://sqs.us-east-1.amazonaws.com/401913772240/Textract_queue"
+notification_channel = {
+    "SNSTopicArn": "arn:aws:sns:us-east-1:401913772240:AmazonTextractTopic",
+    "RoleArn": "arn:aws:iam::401913772240:role/Textract_test_role",
+}
+# Maximum size of a document sent inline to the synchronous textract api
+sync_max_bytes = 10 * 1024 * 1024
+# Errors of textract that are worth retrying
+retry_errors = [
+    "ThrottlingException",
+    "ProvisionedThroughputExceededException",
+    "LimitExceededException",
+    "InternalServerError",
+]
 
 
 class AwsOcr(Document):
@@ -50,18 +68,32 @@ class AwsOcr(Document):
         folder inside s3 bucket in which the file will be stored
     region : str
         aws region of the bucket (verify that textract is available in that region)
+    profile : str
+        aws profile with the credentials (None uses the default credentials)
     filename : str
         name of the file to be processed
-    s3 : boto3.resource
-        s3 resource
+    s3_key : str
+        key of the file in the bucket while it's processed, a unique prefix keeps
+        documents with the same name from overwriting or deleting each other
+    s3 : boto3.client
+        s3 client
     textract : boto3.client
         textract client
     sqs : boto3.client
         sqs client
-    text_response : dict
-        after using `get_text` function, the result goes to this atribute
-    analysis_response : dict
-        after using `get_analysis` function, the result goes to this atribute
+    queue_url : str
+        url of the SQS queue that receives the Textract job notifications
+    job_timeout : float
+        maximum seconds to wait for an asynchronous job (None waits forever)
+    mode : str
+        how multi-page pdfs are processed ("job", "pages" or "auto")
+    text_response : dict or TextractResultReader
+        after using `get_text` function, the result goes to this atribute (a reader
+        of the result pages for pdf files) until it's formatted, then it's None
+    analysis_response : dict or TextractResultReader
+        after using `get_analysis` function, the result goes to this atribute (a
+        reader of the result pages for pdf files) until it's formatted, then it's
+        None
     pages_text : list
         list with the text of the page i at the ith position
     text : str
@@ -71,7 +103,17 @@ class AwsOcr(Document):
     num_pages: int
         number of pages of the document
     pages_tables: list
-        ist with the tables of the page i at the ith position
+        ist with the tables (`Table`) of the page i at the ith position
+    tables: list
+        every table of the document in order
+    pages_forms: list
+        list with the forms (key -> value) of the page i at the ith position
+    forms_index: FormsIndex
+        every key/value pair of the forms with its page, confidences and boxes,
+        for exact and fuzzy key lookup
+    block_store: BlockStore
+        columnar storage of every block of the response, `pages_response` holds
+        lists of blocks that are rebuilt from it on access
 
     Raises
     ------
@@ -88,6 +130,13 @@ class AwsOcr(Document):
         bucket_name="ocr-deep-dive",
         folder=None,
         region="us-east-1",
+        queue_url=textract_queue_url,
+        job_timeout=None,
+        mode="auto",
+        max_sync_pages=15,
+        max_workers=8,
+        max_retries=5,
+        profile=None,
     ):
         """Initialize the AWSOCR class.
         
@@ -104,6 +153,24 @@ class AwsOcr(Document):
         region : str
             aws region of the bucket (verify that textract is available in that region 
             and your bucket is in the same region)by default "us-east-1"
+        queue_url : str
+            url of the SQS queue that receives the Textract job notifications
+        job_timeout : float
+            maximum seconds to wait for an asynchronous job, by default None (no limit)
+        mode : str
+            how multi-page pdfs are processed, "job" (one asynchronous job), "pages"
+            (one synchronous call per page in parallel) or "auto" ("pages" up to
+            `max_sync_pages` pages, "job" otherwise), by default "auto"
+        max_sync_pages : int
+            maximum number of pages processed page by page in "auto" mode, by
+            default 15
+        max_workers : int
+            maximum number of pages sent at the same time in "pages" mode, by
+            default 8
+        max_retries : int
+            retries of a page throttled by textract in "pages" mode, by default 5
+        profile : str
+            aws profile with the credentials, by default None (default credentials)
         
         Raises
         ------
@@ -118,20 +185,28 @@ class AwsOcr(Document):
 
         self.bucket = bucket_name
         self.region = region
-        self.document = {"S3Object": {"Bucket": self.bucket, "Name": self.filename}}
+        self.queue_url = queue_url
+        self.job_timeout = job_timeout
+        self.mode = mode
+        self.max_sync_pages = max_sync_pages
+        self.max_workers = max_workers
+        self.max_retries = max_retries
 
-        self.s3 = self._get_resource_aws("s3")
+        self.profile = profile
+
+        # Shared by every document of the process, see `clients`
+        self.s3 = self._get_client_aws("s3")
         self.textract = self._get_client_aws("textract")
         self.sqs = self._get_client_aws("sqs")
 
         if folder is not None:
             self.filename = folder + "/" + self.filename
+        self.s3_key = self._unique_key()
+        self.document = {"S3Object": {"Bucket": self.bucket, "Name": self.s3_key}}
 
         self.text_response = None
         self.analysis_response = None
 
-        self._upload_to_s3()
-
     def _validate_action(self):
         if self.action not in ["ocr_text", "ocr_tables", "ocr_forms", "ocr_tables_forms"]:
             raise Exception(
@@ -144,46 +219,85 @@ class AwsOcr(Document):
             raise TypeError("File extension {} isn't supported".format(self.extension))
 
     def _get_client_aws(self, service):
-        return boto3.client(service, region_name=self.region)
+        return get_aws_client(service, self.region, self.profile)
 
-    def _get_resource_aws(self, service):
-        return boto3.resource(service, region_name=self.region)
+    def _unique_key(self):
+        """Key of the file in s3, "<folder>/<uuid>/<name>"."""
+        folder, _, name = self.filename.rpartition("/")
+        return "/".join(part for part in (folder, uuid.uuid4().hex, name) if part)
 
     def _upload_to_s3(self):
-        return self.s3.Object(self.bucket, self.filename).put(
-            Body=open(self.file_path, "rb"), ACL="public-read"
-        )
+        with open(self.file_path, "rb") as f:
+            return self.s3.put_object(Bucket=self.bucket, Key=self.s3_key, Body=f)
+
+    def _delete_from_s3(self):
+        return self.s3.delete_object(Bucket=self.bucket, Key=self.s3_key)
 
     def pipeline_extraction(self):
         """Main function to perform the extraction
         """
-        self._process_ocr()
-        self._process_response()
+        run_sync(self.apipeline_extraction())
+
+    async def apipeline_extraction(self):
+        """Asynchronous version of `pipeline_extraction`.
+
+        The upload, the calls to textract and the wait for the job don't block the
+        event loop, so many documents can be processed from the same loop.
+
+        >>> await asyncio.gather(*(doc.apipeline_extraction() for doc in docs))
+        """
+        await self._process_ocr()
+        await run_blocking(self._process_response)
 
-    def _process_ocr(self):
-        if self.action == "text":
-            self._ocr_text()
+    async def _process_ocr(self):
+        if self.action == "ocr_text":
+            await self._ocr_text()
         else:
             FeatureTypes = ["TABLES", "FORMS"]
             if self.action == "ocr_tables":
                 FeatureTypes = ["TABLES"]
-            if self.action == "orc_forms":
+            if self.action == "ocr_forms":
                 FeatureTypes = ["FORMS"]
-            self._ocr_analysis(FeatureTypes)
+            await self._ocr_analysis(FeatureTypes)
 
     def _process_response(self):
         """Uses the ResponseFormatter to format the response to a nice common format.
         """
         Formatter = ResponseFormatter(self)
+        # Every block is in the store now, the raw block dicts are released
+        self.text_response = None
+        self.analysis_response = None
 
         self.pages_text = Formatter.pages_text
         self.text = " ".join(self.pages_text)
         self.pages_response = Formatter.pages_response
         self.num_pages = Formatter.num_pages
         self.pages_tables = Formatter.pages_tables
+        self.tables = [table for tables in self.pages_tables for table in tables]
         self.forms = Formatter.forms
+        self.pages_forms = Formatter.pages_forms
+        self.forms_index = Formatter.forms_index
+        self.block_store = Formatter.store
+
+    def _inline_bytes(self):
+        """Return the bytes of the file if it can be sent inline to textract.
+
+        Images and single page pdfs up to `sync_max_bytes` are sent in the request
+        itself, everything else is staged in s3.
 
-    def _ocr_text(self):
+        Returns
+        -------
+        bytes or None
+            content of the file, None if it has to be staged in s3
+        """
+        if self.extension == "pdf" and self.num_pages > 1:
+            return None
+        if os.path.getsize(self.file_path) > sync_max_bytes:
+            return None
+        with open(self.file_path, "rb") as f:
+            return f.read()
+
+    async def _ocr_text(self):
         """Return the text from the current file.
 
         Notes
@@ -191,26 +305,13 @@ class AwsOcr(Document):
         It overrides the parameter `self.text_response` of the class adding 
         the response of aws api
         """
-        if self.extension == "pdf":
-            response = self.textract.start_document_text_detection(
-                DocumentLocation=self.document,
-                NotificationChannel={
-                    "SNSTopicArn": "arn:aws:sns:us-east-1:401913772240:AmazonTextractTopic",
-                    "RoleArn": "arn:aws:iam::401913772240:role/Textract_test_role",
-                },
-            )
-
-            print("Start Job Id: " + response["JobId"])
-            self.text_response = self._get_job_textract(
-                response, self.textract.get_document_text_detection
-            )
-
-        if self.extension in ["jpg", "jpeg", "png"]:
-            self.text_response = self.textract.detect_document_text(
-                Document=self.document
-            )
+        self.text_response = await self._run_textract(
+            self.textract.detect_document_text,
+            self.textract.start_document_text_detection,
+            self.textract.get_document_text_detection,
+        )
 
-    def _ocr_analysis(self, FeatureTypes=["TABLES", "FORMS"]):
+    async def _ocr_analysis(self, FeatureTypes=["TABLES", "FORMS"]):
         """Return the analysis (text, tables and forms).
         
         Parameters
@@ -218,33 +319,131 @@ class AwsOcr(Document):
         FeatureTypes : list, optional
             You can query only for tables or forms, by default ["TABLES", "FORMS"]
         """
-        if self.extension == "pdf":
-            response = self.textract.start_document_analysis(
+        self.analysis_response = await self._run_textract(
+            self.textract.analyze_document,
+            self.textract.start_document_analysis,
+            self.textract.get_document_analysis,
+            FeatureTypes=FeatureTypes,
+        )
+
+    async def _run_textract(
+        self, sync_function, start_function, get_function, **kwargs
+    ):
+        """Send the file to textract choosing the cheapest way to do it.
+
+        Small images and single page pdfs go inline as bytes to the synchronous
+        api. Multi-page pdfs are staged in s3 and processed with an asynchronous
+        job, big images are staged in s3 and use the synchronous api. Staged
+        objects are deleted as soon as textract doesn't need them.
+
+        Parameters
+        ----------
+        sync_function : function
+            `textract.analyze_document` or `textract.detect_document_text`
+        start_function : function
+            `textract.start_document_analysis` or
+            `textract.start_document_text_detection`
+        get_function : function
+            `textract.get_document_analysis` or `textract.get_document_text_detection`
+        kwargs : dict
+            extra parameters of the textract calls (FeatureTypes)
+
+        Returns
+        -------
+        dict or TextractResultReader
+            textract response
+        """
+        data = await run_blocking(self._inline_bytes)
+        if data is not None:
+            return await run_blocking(sync_function, Document={"Bytes": data}, **kwargs)
+
+        if self._use_pages_mode():
+            pages = await run_blocking(lambda: list(self.iter_pages()))
+            if all(len(page) <= sync_max_bytes for page in pages):
+                return await self._run_pages(sync_function, pages, **kwargs)
+
+        await run_blocking(self._upload_to_s3)
+        try:
+            if self.extension != "pdf":
+                return await run_blocking(
+                    sync_function, Document=self.document, **kwargs
+                )
+
+            response = await run_blocking(
+                start_function,
                 DocumentLocation=self.document,
-                FeatureTypes=FeatureTypes,
-                NotificationChannel={
-                    "SNSTopicArn": "arn:aws:sns:us-east-1:401913772240:AmazonTextractTopic",
-                    "RoleArn": "arn:aws:iam::401913772240:role/Textract_test_role",
-                },
+                NotificationChannel=notification_channel,
+                **kwargs,
             )
-
             print("Start Job Id: " + response["JobId"])
-            self.analysis_response = self._get_job_textract(
-                response, self.textract.get_document_analysis
-            )
+            return await self._get_job_textract(response, get_function)
+        finally:
+            await run_blocking(self._delete_from_s3)
 
-        if self.extension in ["jpg", "jpeg", "png"]:
-            self.analysis_response = self.textract.analyze_document(
-                Document=self.document, FeatureTypes=FeatureTypes
-            )
+    def _use_pages_mode(self):
+        if self.extension != "pdf" or self.mode == "job":
+            return False
+        return self.mode == "pages" or self.num_pages <= self.max_sync_pages
+
+    async def _run_pages(self, sync_function, pages, **kwargs):
+        """Process every page of a pdf with the synchronous api in parallel.
 
-    def _get_job_textract(self, response, get_function):
+        The synchronous api answers in seconds while an asynchronous job can wait
+        in a queue for minutes, for short documents this is much faster. The
+        responses are renumbered and returned in page order so the
+        `ResponseFormatter` sees the same blocks as in a job.
+
+        Parameters
+        ----------
+        sync_function : function
+            `textract.analyze_document` or `textract.detect_document_text`
+        pages : list
+            bytes of the pdf of every page
+        kwargs : dict
+            extra parameters of the textract call (FeatureTypes)
+
+        Returns
+        -------
+        list
+            textract response of the page i at the ith position
+        """
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def process_page(page, data):
+            async with semaphore:
+                response = await self._call_with_retry(
+                    sync_function, Document={"Bytes": data}, **kwargs
+                )
+            for block in response["Blocks"]:
+                block["Page"] = page
+            response["DocumentMetadata"] = {"Pages": len(pages)}
+            return response
+
+        return await asyncio.gather(
+            *(process_page(k + 1, data) for k, data in enumerate(pages))
+        )
+
+    async def _call_with_retry(self, function, **kwargs):
+        """Call textract retrying with exponential backoff when it's throttled."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await run_blocking(function, **kwargs)
+            except ClientError as error:
+                code = error.response.get("Error", {}).get("Code")
+                if code not in retry_errors or attempt == self.max_retries:
+                    raise
+            await asyncio.sleep(min(2 ** attempt, 20) * random.uniform(0.5, 1))
+
+    async def _get_job_textract(self, response, get_function):
         """Process a pdf ocr job in aws.
         
         A job to do OCR is sent in the `get_analysis`  and in the `get_text` functions 
         when the processing is finished a message is published in a queue 
         (we use amazon SQS simple queue service to receive  the response). 
         This function waits until the job is finished and returns it.
+
+        The queue is long-polled by a single `TextractJobDispatcher` per process,
+        so several documents can wait for their jobs at the same time.
         
         Parameters
         ----------
@@ -256,66 +455,26 @@ class AwsOcr(Document):
         
         Returns
         -------
-        dict
-            response of the job
-        """
-
-        def wait(dot_line):
-
-            if dot_line % 20 == 0:
-                print()
-            for _ in range(5):
-                print(".", end="")
-                sys.stdout.flush()
-                time.sleep(0.5)
-            return dot_line + 5
-
-        def build_response(response):
-            aux = get_function(JobId=response["JobId"])
-            ans = copy.deepcopy(aux)
-            while "NextToken" in aux:
-                aux = get_function(JobId=response["JobId"], NextToken=aux["NextToken"])
-                ans["Blocks"].extend(aux["Blocks"])
-            return ans
-
-        url_queue = "https://sqs.us-east-1.amazonaws.com/401913772240/Textract_queue"
-        dot_line = 0
-        jobFound = False
-
-        while jobFound is False:
-            sqsResponse = self.sqs.receive_message(
-                QueueUrl=url_queue,
-                MessageAttributeNames=["ALL"],
-                MaxNumberOfMessages=10,
-            )
-
-            if sqsResponse:
-                if "Messages" not in sqsResponse:
-                    dot_line = wait(dot_line)
-                    continue
+        TextractResultReader
+            reader that streams the result pages of the job
 
-                for message in sqsResponse["Messages"]:
-
-                    notification = json.loads(message["Body"])
-                    if "Message" not in notification:
-                        continue
-                    textMessage = json.loads(notification["Message"])
+        Raises
+        ------
+        Exception
+            If the job didn't succeed
+        """
 
-                    if str(textMessage["JobId"]) == response["JobId"]:
-                        ans = build_response(response)
-                        self.sqs.delete_message(
-                            QueueUrl=url_queue, ReceiptHandle=message["ReceiptHandle"]
-                        )
-                        jobFound = True
+        dispatcher = get_dispatcher(self.sqs, self.queue_url)
+        status = await dispatcher.wait_async(
+            response["JobId"], timeout=self.job_timeout
+        )
+        if status != "SUCCEEDED":
+            raise Exception(f"Textract job {response['JobId']} finished with {status}")
 
-        return ans
+        return TextractResultReader(get_function, response["JobId"])
 
-    def table_to_pandas(self, num_table):
-        return pd.DataFrame.from_dict(self.tables[num_table], orient="index")
+    def table_to_pandas(self, num_table, fill_merged=True):
+        return as_table(self.tables[num_table]).to_pandas(fill_merged)
 
-    def tables_to_xlsx(self, filename="tables_found.xlsx"):
-        writer = pd.ExcelWriter(filename, engine="xlsxwriter")
-        for k, table in enumerate(self.tables):
-            df = self.table_to_pandas(k)
-            df.to_excel(writer, sheet_name="Table_{}".format(str(k)))
-        writer.save()
+    def tables_to_xlsx(self, filename="tables_found.xlsx", engine=None):
+        tables_to_xlsx(self.pages_tables, filename, engine)
@@ -1,59 +1,155 @@
-import pandas as pd
+import numpy as np
+
+from .aws_block_store import BlockList, BlockStore
+from .forms_index import FormsIndex
+from .table import Table
 
 
 class ResponseFormatter:
-    def __init__(self, Aws_ocr):
+    """Format textract responses to the common output of the OCR engines.
+
+    Every block is classified only once when it is added: it's appended to a
+    columnar `BlockStore`, its id goes to the current page and tables and form keys
+    are indexed by id. Relationships between blocks can point to blocks that
+    arrive later, so tables and forms are resolved in `finalize`.
+
+    >>> formatter = ResponseFormatter(response_type="analysis")
+    >>> for response in reader:
+    ...     formatter.add_response(response)
+    >>> formatter.finalize()
+
+    Parameters
+    ----------
+    Aws_ocr : AwsOcr, optional
+        AwsOcr object with `analysis_response` or `text_response`, if given the
+        responses are added and the formatter is finalized right away
+    response_type : str, optional
+        "analysis" or "text", only needed when no `Aws_ocr` is given
+
+    Attributes
+    ----------
+    store : BlockStore
+        every block added, blocks are referenced by their integer id in the store
+    table_ids : list
+        ids of the TABLE blocks
+    key_ids : list
+        ids of the KEY_VALUE_SET blocks that are keys
+    pages_text : list
+        text of the page i at the ith position
+    pages_response : list
+        `BlockList` with the blocks with text of the page i at the ith position
+    pages_tables : list
+        tables of the page i at the ith position
+    forms : dict
+        key text -> value text
+    forms_index : FormsIndex
+        every key/value pair with its page, confidences and boxes
+    pages_forms : list
+        forms of the page i at the ith position
+    num_pages : int
+        number of pages of the document
+    """
+
+    def __init__(self, Aws_ocr=None, response_type=None):
         self.Aws_ocr = Aws_ocr
+        self.response_type = response_type
+
+        self.store = BlockStore()
+        self.table_ids = []
+        self.key_ids = []
+        self.num_pages = None
+
+        self.pages_text = []
+        self.pages_response = []
+        self.pages_tables = []
+        self.forms = {}
+        self.pages_forms = []
+        self.forms_index = None
+
+        self._pages_blocks = []
+
+        if Aws_ocr is None:
+            return
 
         if self.Aws_ocr.analysis_response is not None:
-            self.response = self.Aws_ocr.analysis_response
+            result = self.Aws_ocr.analysis_response
             self.response_type = "analysis"
         elif self.Aws_ocr.text_response is not None:
-            self.response = self.Aws_ocr.text_response
+            result = self.Aws_ocr.text_response
             self.response_type = "text"
         else:
             raise Exception(
-                """You have to execute `get_text` or `get_analysis` in the AWS_OCR 
+                """You have to execute `get_text` or `get_analysis` in the AWS_OCR
                 class before building a response formatter object"""
             )
 
-        # Get all response blocks
-        if 'Blocks' not in self.response:
-            print(self.response)
-            raise 
-        self.blocks = self.response["Blocks"]
-
-        # Get blocks mapping
-        self.blocks_map = {block["Id"]: block for block in self.blocks}
-
-        # Get key mapping (for forms)
-        self.key_map = {
-            block["Id"]: block
-            for block in self.blocks
-            if block["BlockType"] == "KEY_VALUE_SET" and "KEY" in block["EntityTypes"]
-        }
-        # Get value mapping (for forms)
-        self.value_map = {
-            block["Id"]: block
-            for block in self.blocks
-            if block["BlockType"] == "KEY_VALUE_SET"
-            and "KEY" not in block["EntityTypes"]
-        }
-
-        self.pages_text = []
-        self.pages_response = []
-        self.pages_tables = []
-
-        self._get_per_page()
-        self.num_pages = self.response["DocumentMetadata"]["Pages"]
+        # Result pages are consumed as they arrive, the raw responses aren't kept
+        responses = [result] if isinstance(result, dict) else result
+        for response in responses:
+            self.add_response(response)
+
+        self.finalize()
+
+    def add_response(self, response):
+        """Add one result page of textract (a dict with `Blocks`) to the formatter.
+
+        Parameters
+        ----------
+        response : dict
+            textract response or one of the pages of a paginated response
+        """
+        if "Blocks" not in response:
+            print(response)
+            raise Exception("Textract response without Blocks")
+        if self.num_pages is None:
+            self.num_pages = response["DocumentMetadata"]["Pages"]
+        self.add_blocks(response["Blocks"])
+
+    def add_blocks(self, blocks):
+        """Add a batch of textract blocks to the formatter.
+
+        Parameters
+        ----------
+        blocks : list
+            textract blocks, in the order given by textract
+        """
+        for block in blocks:
+            block_type = block["BlockType"]
+            block_id = self.store.add(block)
+
+            if block_type == "PAGE" or not self._pages_blocks:
+                self._pages_blocks.append([])
+            if block_type != "PAGE":
+                if "Text" in block:
+                    self._pages_blocks[-1].append(block_id)
+                if block_type == "TABLE":
+                    self.table_ids.append(block_id)
+                elif block_type == "KEY_VALUE_SET" and "KEY" in block["EntityTypes"]:
+                    self.key_ids.append(block_id)
+
+    def finalize(self):
+        """Build the text, tables and forms once every block has been added."""
+        self.store.finalize()
+        self._word = self.store.type_code("WORD")
+        self._selection = self.store.type_code("SELECTION_ELEMENT")
+        self._cell = self.store.type_code("CELL")
+        self._merged_cell = self.store.type_code("MERGED_CELL")
+
+        self.pages_response = [
+            BlockList(self.store, block_ids) for block_ids in self._pages_blocks
+        ]
+        self.pages_text = [
+            " ".join(self.store.text(k) for k in page.indices) + " " if len(page) else ""
+            for page in self.pages_response
+        ]
+        self._pages_blocks = []
+        if self.num_pages is None:
+            self.num_pages = len(self.pages_text)
 
         if self.response_type == "analysis":
 
-            self.tables = [
-                self._get_table(block)
-                for block in self.blocks
-                if block["BlockType"] == "TABLE"
-            ]
+            self._merged_cells = self._get_merged_cells()
+            self.tables = [self._get_table(table_id) for table_id in self.table_ids]
 
             self.pages_tables = [[] for _ in range(self.num_pages)]
             for table in self.tables:
@@ -62,65 +158,86 @@ class ResponseFormatter:
             self.num_tables = len(self.tables)
             self._get_kv_relationship()
 
-            # Falta añadir formas
-
-    def _get_per_page(self):
-        text, blocks = "", []
-
-        first_iteration = True
-        for block in self.blocks:
-            if block["BlockType"] == "PAGE":
-                if not first_iteration:
-                    self.pages_text.append(text)
-                    self.pages_response.append(blocks)
-                    text = ""
-                    blocks = []
-            elif "Text" in block:
-                text += block["Text"] + " "
-                blocks.append(block)
-            first_iteration = False
-
-        self.pages_text.append(text)
-        self.pages_response.append(blocks)
-
-    def _get_block_text(self, block):
-        text = ""
-        if "Relationships" in block:
-            for relationship in block["Relationships"]:
-                if relationship["Type"] == "CHILD":
-                    for child_id in relationship["Ids"]:
-                        word = self.blocks_map[child_id]
-                        if word["BlockType"] == "WORD":
-                            text += word["Text"] + " "
-                        if word["BlockType"] == "SELECTION_ELEMENT":
-                            if word["SelectionStatus"] == "SELECTED":
-                                text += "X "
-        return text
-
-    def _get_table(self, table):
-        dict_table = {}
-        page = table["Page"] if "Page" in table else 1
-        for relationship in table["Relationships"]:
-            if relationship["Type"] == "CHILD":
-                for child_id in relationship["Ids"]:
-                    cell = self.blocks_map[child_id]
-                    if cell["BlockType"] == "CELL":
-                        dict_table.setdefault(cell["RowIndex"], {})[
-                            cell["ColumnIndex"]
-                        ] = self._get_block_text(cell)
-        return {"page": page, "table": dict_table}
+    def _get_block_text(self, block_id):
+        words = []
+        for child_id in self.store.children(block_id):
+            child_type = self.store.types[child_id]
+            if child_type == self._word:
+                words.append(self.store.text(child_id))
+            if child_type == self._selection and self.store.is_selected(child_id):
+                words.append("X")
+        return " ".join(words) + " " if words else ""
+
+    def _get_merged_cells(self):
+        """Return table id -> ids of its MERGED_CELL blocks.
+
+        Merged cells are children of their table in a MERGED_CELL relationship,
+        which isn't stored, so they're matched through the table of their cells.
+        """
+        table_of_cell = {
+            int(cell_id): table_id
+            for table_id in self.table_ids
+            for cell_id in self.store.children(table_id)
+        }
+        merged_cells = {}
+        for merged_id in self.store.ids_of_type("MERGED_CELL"):
+            cell_ids = self.store.children(merged_id)
+            if len(cell_ids) and int(cell_ids[0]) in table_of_cell:
+                table_id = table_of_cell[int(cell_ids[0])]
+                merged_cells.setdefault(table_id, []).append(merged_id)
+        return merged_cells
+
+    def _get_table(self, table_id):
+        page = int(self.store.pages[table_id])
+        children = self.store.children(table_id)
+        cell_ids = children[self.store.types[children] == self._cell]
+        cells = self.store.cells[cell_ids]
+
+        # Regions of the merged cells and of the cells that span many rows/columns
+        spans = cells[(cells[:, 2] > 1) | (cells[:, 3] > 1)]
+        merged_ids = self._merged_cells.get(table_id, [])
+        merged = np.concatenate([spans, self.store.cells[merged_ids].reshape(-1, 4)])
+
+        table = Table(
+            cells[:, 0],
+            cells[:, 1],
+            [self._get_block_text(cell_id) for cell_id in cell_ids],
+            merged,
+        )
+        return {"page": page, "table": table}
 
     def _get_kv_relationship(self):
-        def _find_value_block(key_block, value_map):
-            for relationship in key_block["Relationships"]:
-                if relationship["Type"] == "VALUE":
-                    for value_id in relationship["Ids"]:
-                        value_block = value_map[value_id]
-            return value_block
-
+        """Build the `FormsIndex` of the key/value pairs and the forms dicts."""
+        key_ids = np.array(self.key_ids, dtype=np.int64)
+        # The value of a key is the last block of its VALUE relationship
+        starts = self.store.value_indptr[key_ids]
+        ends = self.store.value_indptr[key_ids + 1]
+        has_value = ends > starts
+        value_ids = np.full(len(key_ids), -1, dtype=np.int64)
+        value_ids[has_value] = self.store.value_indices[ends[has_value] - 1]
+
+        value_boxes = np.full((len(key_ids), 4), np.nan, dtype=np.float32)
+        value_boxes[has_value] = self.store.boxes[value_ids[has_value]]
+        value_confidences = np.full(len(key_ids), np.nan, dtype=np.float32)
+        value_confidences[has_value] = self.store.confidences[value_ids[has_value]]
+
+        self.forms_index = FormsIndex(
+            self.store.pages[key_ids] - 1,
+            [self._get_block_text(key_id) for key_id in key_ids],
+            [
+                self._get_block_text(value_id) if value_id >= 0 else ""
+                for value_id in value_ids
+            ],
+            self.store.boxes[key_ids],
+            value_boxes,
+            self.store.confidences[key_ids],
+            value_confidences,
+        )
+
+        # Repeated keys keep the last value in the dicts, the index keeps them all
         self.forms = {}
-        for block_id, key_block in self.key_map.items():
-            value_block = _find_value_block(key_block, self.value_map)
-            key = self._get_block_text(key_block)
-            val = self._get_block_text(value_block)
+        self.pages_forms = [{} for _ in range(self.num_pages)]
+        index = self.forms_index
+        for page, key, val in zip(index.pages, index.keys, index.values):
             self.forms[key] = val
+            self.pages_forms[page][key] = val
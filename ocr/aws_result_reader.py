@@ -0,0 +1,100 @@
+"""Streaming reader of the paginated results of a Textract asynchronous job.
+
+`get_document_analysis` and `get_document_text_detection` return the result of
+a job in pages of at most 1000 blocks linked by a `NextToken`. The reader yields
+every page as soon as it arrives while the next one is already being fetched in
+a background thread, so the network round trips overlap with the processing of
+the blocks and the full response is never merged into a single dict.
+
+>>> reader = TextractResultReader(textract.get_document_analysis, job_id)
+>>> for response in reader:
+...     formatter.add_response(response)
+"""
+
+# Standart python libraries
+import queue
+import threading
+
+_end = object()
+
+
+class TextractResultReader:
+    """Iterate over the result pages of a finished Textract job.
+
+    Parameters
+    ----------
+    get_function : function
+        `textract.get_document_analysis` or `textract.get_document_text_detection`
+    job_id : str
+        JobId of the finished job
+    prefetch : int, optional
+        number of result pages fetched ahead of the consumer, by default 2
+
+    Attributes
+    ----------
+    document_metadata : dict
+        `DocumentMetadata` of the job, available after the first page is read
+    num_responses : int
+        number of result pages read so far
+    """
+
+    def __init__(self, get_function, job_id, prefetch=2):
+        self.get_function = get_function
+        self.job_id = job_id
+        self.prefetch = prefetch
+
+        self.document_metadata = None
+        self.num_responses = 0
+
+    def __iter__(self):
+        pages = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+
+        fetcher = threading.Thread(
+            target=self._fetch, args=(pages, stop), name="textract-reader", daemon=True
+        )
+        fetcher.start()
+        try:
+            while True:
+                response = pages.get()
+                if response is _end:
+                    return
+                if isinstance(response, BaseException):
+                    raise response
+                if self.document_metadata is None:
+                    self.document_metadata = response.get("DocumentMetadata")
+                self.num_responses += 1
+                yield response
+        finally:
+            stop.set()
+
+    def iter_blocks(self):
+        """Yield the blocks of the job one by one.
+
+        Yields
+        ------
+        dict
+            textract block
+        """
+        for response in self:
+            yield from response["Blocks"]
+
+    def _fetch(self, pages, stop):
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        try:
+            response = self.get_function(JobId=self.job_id)
+            while put(response) and "NextToken" in response:
+                response = self.get_function(
+                    JobId=self.job_id, NextToken=response["NextToken"]
+                )
+            put(_end)
+        except Exception as error:
+            put(error)
@@ -0,0 +1,210 @@
+"""Persistent local cache of OCR results.
+
+Results are keyed by the SHA-256 of the file bytes, the engine, the action and
+the engine settings that change the output, so the same file is never sent twice
+to a paid engine. Each entry is a zlib compressed pickle of the normalized results
+(`pages_text`, `pages_tables`, `forms`, `pages_response`...) and the least
+recently used entries are removed once the folder exceeds `max_size` bytes.
+
+The size of the folder is kept in a running counter, it's only scanned the first
+time an entry is stored and when the counter goes over `max_size`. Eviction then
+goes down to `low_water` of `max_size` so the next puts don't scan again.
+
+>>> cache = ResultCache("~/.cache/ocr", max_size=2 * 1024 ** 3)
+>>> key = cache.key(file_path, "aws", "ocr_tables")
+>>> results = cache.get(key)
+"""
+
+# Standart python libraries
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import zlib
+
+default_folder = os.path.join("~", ".cache", "ocr")
+extension = ".pkl.z"
+# Share of `max_size` left after evicting
+low_water = 0.9
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """Return the hex SHA-256 of the bytes of a file."""
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class ResultCache:
+    """Content addressed, size bounded cache of OCR results in a local folder.
+
+    Parameters
+    ----------
+    folder : str, optional
+        folder where the entries are stored, by default "~/.cache/ocr"
+    max_size : int, optional
+        maximum size in bytes of the folder, by default 1 GB
+    compression : int, optional
+        zlib compression level, by default 6
+
+    Attributes
+    ----------
+    hits : int
+        number of results found in the cache
+    misses : int
+        number of results not found in the cache
+    """
+
+    def __init__(self, folder=default_folder, max_size=1024**3, compression=6):
+        self.folder = os.path.expanduser(folder)
+        self.max_size = max_size
+        self.compression = compression
+        os.makedirs(self.folder, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Bytes of the entries, None until the folder is scanned
+        self._size = None
+
+    def key(self, file_path, engine, action, **params):
+        """Build the key of the results of a file.
+
+        Parameters
+        ----------
+        file_path : str
+            local path to the file
+        engine : str
+            engine used to process the file
+        action : str
+            action performed on the file
+        params : dict
+            engine settings that change the results
+
+        Returns
+        -------
+        str
+            hex digest that identifies the results
+        """
+        return self.content_key(file_sha256(file_path), engine, action, **params)
+
+    def content_key(self, digest, engine, action, **params):
+        """Build a key from the digest of the content instead of a file path."""
+        settings = ",".join(f"{name}={params[name]!r}" for name in sorted(params))
+        description = f"{digest}|{engine}|{action}|{settings}"
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, key[:2], key + extension)
+
+    def get(self, key):
+        """Return the results stored with `key` or None if there aren't any.
+
+        Parameters
+        ----------
+        key : str
+            key built with `key`
+
+        Returns
+        -------
+        dict or None
+            attribute name -> value of the stored results
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                results = pickle.loads(zlib.decompress(f.read()))
+        except (OSError, EOFError, zlib.error, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+
+        # The modification time is the last use of the entry, it may have been
+        # evicted by another document since it was read
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return results
+
+    def put(self, key, results):
+        """Store `results` with `key` and evict old entries if needed.
+
+        Parameters
+        ----------
+        key : str
+            key built with `key`
+        results : dict
+            attribute name -> value of the results, it must be picklable
+        """
+        data = zlib.compress(
+            pickle.dumps(results, protocol=pickle.HIGHEST_PROTOCOL), self.compression
+        )
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        try:
+            replaced = os.stat(path).st_size
+        except OSError:
+            replaced = 0
+
+        # Write in a temporary file first so readers never see half an entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self.size()
+            else:
+                self._size += len(data) - replaced
+            over_budget = self._size > self.max_size
+        if over_budget:
+            self._evict()
+
+    def _entries(self):
+        for folder, _, filenames in os.walk(self.folder):
+            for filename in filenames:
+                if filename.endswith(extension):
+                    path = os.path.join(folder, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, path
+
+    def size(self):
+        """Return the total size in bytes of the entries."""
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        """Remove the least recently used entries until the folder is under
+        `low_water` of `max_size`, the folder is scanned to get the real size
+        (other processes may share it)."""
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            if total > self.max_size:
+                for _, size, path in entries:
+                    if total <= low_water * self.max_size:
+                        break
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        continue
+                    total -= size
+            self._size = total
+
+    def clear(self):
+        """Remove every entry of the cache."""
+        with self._lock:
+            for _, _, path in list(self._entries()):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+            self._size = 0
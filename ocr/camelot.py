@@ -1,11 +1,246 @@
+"""Module to extract the tables of pdfs with a text layer using camelot.
+
+Camelot has two flavors: "lattice" finds the cells from the lines drawn in the
+page and "stream" from the spaces between words. Instead of running both, the
+flavor of every page is chosen from the horizontal and vertical segments drawn in
+its content stream (cheap to count, nothing is rendered) and the pages are read
+in parallel in a pool of processes. The tables have the same shape as the ones of
+`AwsOcr`, `Table` objects read as {row: {column: text}} starting at 1.
+
+>>> doc = Camelot(file_path, workers=4)
+>>> doc.pipeline_extraction()
+>>> doc.flavors, doc.pages_tables[0]
+"""
+
+# Standart python libraries
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# 3rd party libraries
+import camelot
+from PyPDF2 import PdfFileReader
+from PyPDF2.pdf import ContentStream
+
+# Own
+from .async_utils import run_blocking, run_sync
 from .ocr_document import Document
+from .table import Table
+
+admitted_extensions = ["pdf"]
+flavors = ["lattice", "stream"]
+# Segments a page needs in both directions to be read as "lattice"
+min_ruling_lines = 3
+stroking_operators = {b"S", b"s", b"B", b"B*", b"b", b"b*"}
+painting_operators = stroking_operators | {b"f", b"F", b"f*"}
+
+# (workers, executor)
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def count_ruling_lines(page, min_length=20):
+    """Count the horizontal and vertical segments drawn in a pdf page.
+
+    Painted lines ("m" and "l" operators) and thin rectangles ("re") are counted,
+    the border of a stroked rectangle counts as two segments in each direction.
+    Transformations are ignored, it's only a hint to choose the flavor.
+
+    Parameters
+    ----------
+    page : PyPDF2.pdf.PageObject
+        page of the pdf
+    min_length : float, optional
+        minimum length in points of a segment, by default 20
+
+    Returns
+    -------
+    int
+        horizontal segments
+    int
+        vertical segments
+    """
+    contents = page.getContents()
+    if contents is None:
+        return 0, 0
+
+    horizontal = vertical = 0
+    # Segments of the current path, they only count once the path is painted
+    path = []
+    x = y = 0.0
+    for operands, operator in ContentStream(contents, page.pdf).operations:
+        if operator == b"m":
+            x, y = map(float, operands)
+        elif operator == b"l":
+            x1, y1 = map(float, operands)
+            if abs(y1 - y) < 1 and abs(x1 - x) >= min_length:
+                path.append((1, 0, False))
+            elif abs(x1 - x) < 1 and abs(y1 - y) >= min_length:
+                path.append((0, 1, False))
+            x, y = x1, y1
+        elif operator == b"re":
+            width, height = (abs(float(operand)) for operand in operands[2:])
+            if height < 2 and width >= min_length:
+                path.append((1, 0, False))
+            elif width < 2 and height >= min_length:
+                path.append((0, 1, False))
+            elif width >= min_length and height >= min_length:
+                # Only the border of a rectangle is a line, not its fill
+                path.append((2, 2, True))
+        elif operator in painting_operators:
+            stroked = operator in stroking_operators
+            for h, v, needs_stroke in path:
+                if stroked or not needs_stroke:
+                    horizontal += h
+                    vertical += v
+            path = []
+        elif operator == b"n":
+            # Clipping paths aren't painted
+            path = []
+    return horizontal, vertical
+
+
+def choose_flavor(page):
+    """Return "lattice" if the page has ruling lines in both directions, else
+    "stream" (also when the content stream of the page can't be parsed)."""
+    try:
+        horizontal, vertical = count_ruling_lines(page)
+    except Exception:
+        return "stream"
+    if horizontal >= min_ruling_lines and vertical >= min_ruling_lines:
+        return "lattice"
+    return "stream"
+
+
+def _read_page(file_path, page, flavor, options):
+    """Read the tables of one page in a worker process.
+
+    Returns
+    -------
+    list
+        tables of the page
+    """
+    tables = camelot.read_pdf(file_path, pages=str(page), flavor=flavor, **options)
+    return [Table.from_grid(table.df.values.tolist()) for table in tables]
+
+
+def submit(workers, function, *args):
+    """Submit a call to the process-wide pool of processes that read pages.
+
+    The pool is replaced when a document asks for a different number of `workers`
+    and the old one is shut down.
+
+    Returns
+    -------
+    concurrent.futures.Future
+        future with the result of the call
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None or _executor[0] != workers:
+            if _executor is not None:
+                # The pages already submitted are read before the processes exit
+                _executor[1].shutdown(wait=False)
+            _executor = (workers, ProcessPoolExecutor(max_workers=workers))
+        return _executor[1].submit(function, *args)
 
 
 class Camelot(Document):
-    def __init__(self, file_path):
+    """Class to extract the tables of pdfs with a text layer.
+
+    Parameters
+    ----------
+    Document : Object
+        super class with the basic atributes to handle a document
+
+    Attributes
+    ----------
+    file_path : str
+        local path to the file that will be processed
+    flavor : str
+        "lattice", "stream" or "auto" (chosen per page with `choose_flavor`)
+    workers : int
+        number of processes that read pages
+    options : dict
+        camelot options of each flavor, {"lattice": {...}, "stream": {...}}
+    flavors : list
+        flavor used in the page i at the ith position
+    tables : list
+        every table (`Table`) of the document in order
+    pages_tables : list
+        list with the tables of the page i at the ith position
+    num_tables : int
+        number of tables of the document
+    num_pages: int
+        number of pages of the document
+
+    Raises
+    ------
+    TypeError
+        If your file extension isn't supporter. Supported files are pdfs.
+    """
+
+    def __init__(
+        self,
+        file_path,
+        flavor="auto",
+        workers=None,
+        lattice_options=None,
+        stream_options=None,
+    ):
         super().__init__(file_path)
+        self._validate_extension()
+
+        if flavor not in flavors + ["auto"]:
+            raise Exception(f"Flavor {flavor} isn't supported, use one from {flavors}")
+        self.flavor = flavor
+        self.workers = workers or os.cpu_count() or 1
+        self.options = {
+            "lattice": lattice_options or {},
+            "stream": stream_options or {},
+        }
+
+        self.flavors = None
+        self.tables = None
+        self.num_tables = None
+
+    def _validate_extension(self):
+        if self.extension not in admitted_extensions:
+            raise TypeError("File extension {} isn't supported".format(self.extension))
+
+    def pipeline_extraction(self):
+        """Main function to perform the extraction
+        """
+        run_sync(self.apipeline_extraction())
+
+    async def apipeline_extraction(self):
+        """Asynchronous version of `pipeline_extraction`."""
+        self.flavors = await run_blocking(self._choose_flavors)
+
+        self.pages_tables = await asyncio.gather(
+            *(
+                asyncio.wrap_future(
+                    submit(
+                        self.workers,
+                        _read_page,
+                        self.file_path,
+                        page + 1,
+                        flavor,
+                        self.options[flavor],
+                    )
+                )
+                for page, flavor in enumerate(self.flavors)
+            )
+        )
+
+        self.tables = [table for tables in self.pages_tables for table in tables]
+        self.num_tables = len(self.tables)
 
+    def _choose_flavors(self):
+        if self.flavor != "auto":
+            return [self.flavor] * self.num_pages
+        with open(self.file_path, "rb") as f:
+            inputpdf = PdfFileReader(f)
+            return [choose_flavor(page) for page in inputpdf.pages]
 
-# metrics
-# Función que automáticamente decida stream o latice
-# función que maximice métrica con búsqueda de grid (parámetros)
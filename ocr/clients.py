@@ -0,0 +1,106 @@
+"""Process-wide pool of the cloud clients shared by the documents.
+
+Building a boto3 or google cloud client loads its service model or parses the
+credentials, and every new client opens its own connections, so the engines
+borrow their clients from here instead of creating them per document. Clients
+are created once per service, region and credentials. They are thread safe and
+keep a pool of keep-alive connections big enough for the documents processed at
+the same time.
+
+>>> textract = get_aws_client("textract", "us-east-1")
+>>> vision_client, storage_client = get_google_clients(credentials_path)
+"""
+
+# Standart python libraries
+import threading
+
+# Connections kept open by each client, `Ocr.process_batch` runs 8 documents by
+# default and each one can run 8 textract calls at the same time
+max_pool_connections = 64
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_aws_client(service, region, profile=None):
+    """Return the shared boto3 client of a service.
+
+    Parameters
+    ----------
+    service : str
+        aws service ("s3", "textract", "sqs"...)
+    region : str
+        aws region
+    profile : str, optional
+        aws profile with the credentials, by default the default credentials
+
+    Returns
+    -------
+    boto3.client
+        client of the service
+    """
+    key = ("aws", service, region, profile)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    import boto3
+    from botocore.config import Config
+
+    with _clients_lock:
+        if key not in _clients:
+            # Sessions aren't thread safe, every client gets its own
+            session = boto3.session.Session(profile_name=profile)
+            _clients[key] = session.client(
+                service,
+                region_name=region,
+                config=Config(
+                    max_pool_connections=max_pool_connections, tcp_keepalive=True
+                ),
+            )
+        return _clients[key]
+
+
+def get_google_clients(credentials_path):
+    """Return the shared vision and storage clients of a service account.
+
+    Parameters
+    ----------
+    credentials_path : str
+        path to the json file of the service account
+
+    Returns
+    -------
+    vision.ImageAnnotatorClient
+        vision client
+    storage.Client
+        storage client
+    """
+    key = ("google", credentials_path)
+    clients = _clients.get(key)
+    if clients is not None:
+        return clients
+
+    from google.cloud import vision, storage
+    from google.oauth2 import service_account
+
+    with _clients_lock:
+        if key not in _clients:
+            # The json is parsed once for both clients
+            credentials = service_account.Credentials.from_service_account_file(
+                credentials_path
+            )
+            _clients[key] = (
+                vision.ImageAnnotatorClient(credentials=credentials),
+                storage.Client(
+                    project=credentials.project_id, credentials=credentials
+                ),
+            )
+        return _clients[key]
+
+
+def clear_clients():
+    """Forget every client, the next documents create new ones (after a fork for
+    example)."""
+    with _clients_lock:
+        _clients.clear()
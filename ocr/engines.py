@@ -0,0 +1,177 @@
+"""Registry of the engines the `Ocr` facade can use.
+
+Engines are registered by name with their actions and the "module:Class" path of
+their class, the module is imported the first time a document uses the engine so
+a worker that only uses tika never imports boto3 or google cloud. Other packages
+can add engines through the "ocr.engines" entry point group, the entry point name
+is the engine name and it must point to an `EngineSpec`.
+
+>>> register_engine("my_engine", ["ocr_text"], "my_package.module:MyOcr")
+>>> Engine = get_engine("my_engine").load()
+"""
+
+# Standart python libraries
+import importlib
+import threading
+from importlib import metadata
+
+entry_point_group = "ocr.engines"
+
+_registry = {}
+_registry_lock = threading.Lock()
+_entry_points_loaded = False
+
+
+class EngineSpec:
+    """Description of an engine, its class is only imported by `load`.
+
+    Parameters
+    ----------
+    name : str
+        name of the engine used in `Ocr(file_path, action, name)`
+    actions : list
+        actions supported by the engine
+    target : str
+        "module:Class" path of the class of the engine, relative paths
+        (".module:Class") are resolved inside this package
+    build : function, optional
+        function(Engine, doc, file_path, action) that creates the engine for an
+        `Ocr` document with its settings, by default `Engine(file_path)`
+    """
+
+    __slots__ = ("name", "actions", "target", "build", "_engine")
+
+    def __init__(self, name, actions, target, build=None):
+        self.name = name
+        self.actions = list(actions)
+        self.target = target
+        self.build = build or (lambda Engine, doc, file_path, action: Engine(file_path))
+        self._engine = None
+
+    def load(self):
+        """Import and return the class of the engine."""
+        if self._engine is None:
+            module, _, name = self.target.partition(":")
+            # Targets of the built-in engines are relative to this package
+            module = importlib.import_module(module, package=__package__)
+            self._engine = getattr(module, name)
+        return self._engine
+
+    def create(self, doc, file_path, action):
+        """Create the engine that processes `file_path` for an `Ocr` document."""
+        return self.build(self.load(), doc, file_path, action)
+
+
+def register_engine(name, actions, target, build=None):
+    """Add an engine to the registry, an engine with the same name is replaced.
+
+    Parameters
+    ----------
+    name, actions, target, build
+        as in `EngineSpec`
+
+    Returns
+    -------
+    EngineSpec
+        registered engine
+    """
+    spec = EngineSpec(name, actions, target, build)
+    with _registry_lock:
+        _registry[name] = spec
+    return spec
+
+
+def _load_entry_points():
+    global _entry_points_loaded
+    with _registry_lock:
+        if _entry_points_loaded:
+            return
+        _entry_points_loaded = True
+
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, "select"):
+        entry_points = entry_points.select(group=entry_point_group)
+    else:
+        entry_points = entry_points.get(entry_point_group, [])
+
+    for entry_point in entry_points:
+        spec = entry_point.load()
+        with _registry_lock:
+            _registry.setdefault(entry_point.name, spec)
+
+
+def get_engine(name):
+    """Return the `EngineSpec` of an engine, looking in the entry points if it
+    isn't registered.
+
+    Raises
+    ------
+    KeyError
+        If there isn't an engine with that name.
+    """
+    if name not in _registry:
+        _load_entry_points()
+    return _registry[name]
+
+
+def available_engines(entry_points=True):
+    """Return engine name -> supported actions of every engine.
+
+    Parameters
+    ----------
+    entry_points : bool, optional
+        if False only the engines already registered are returned, without
+        looking for the engines of other packages, by default True
+    """
+    if entry_points:
+        _load_entry_points()
+    return {name: spec.actions for name, spec in _registry.items()}
+
+
+def _build_aws(Engine, doc, file_path, action):
+    return Engine(
+        file_path,
+        action,
+        doc.aws_bucket,
+        doc.aws_folder,
+        doc.aws_region,
+        profile=doc.aws_profile,
+    )
+
+
+def _build_tika(Engine, doc, file_path, action):
+    ocr = True if "ocr" in action else False
+    return Engine(file_path, ocr, workers=doc.tika_workers, **doc.rasterization)
+
+
+def _build_tesseract(Engine, doc, file_path, action):
+    return Engine(
+        file_path, doc.tesseract_lang, doc.tesseract_workers, **doc.rasterization
+    )
+
+
+def _build_camelot(Engine, doc, file_path, action):
+    return Engine(file_path, doc.camelot_flavor, doc.camelot_workers)
+
+
+def _build_google(Engine, doc, file_path, action):
+    return Engine(
+        file_path, compact=doc.google_compact, batch_size=doc.google_batch_size
+    )
+
+
+register_engine("google", ["ocr_text", "auto"], ".google_ocr:GoogleOcr", _build_google)
+register_engine(
+    "aws",
+    ["ocr_text", "ocr_tables", "ocr_forms", "ocr_tables_forms", "auto"],
+    ".aws_ocr:AwsOcr",
+    _build_aws,
+)
+register_engine("tika", ["ocr_text", "text", "auto"], ".tika_ocr:TikaOcr", _build_tika)
+register_engine("camelot", ["tables"], ".camelot:Camelot", _build_camelot)
+register_engine(
+    "tesseract",
+    ["ocr_text", "auto"],
+    ".tesseract_ocr:TesseractOcr",
+    _build_tesseract,
+)
@@ -0,0 +1,303 @@
+"""Index of the key/value pairs of forms with exact and fuzzy key lookup.
+
+`forms` and `pages_forms` are dicts keyed by the text of the keys, so repeated keys
+overwrite each other and looking a field up means scanning dicts. `FormsIndex`
+keeps every pair with its page, confidences and boxes in flat arrays. Keys are
+normalized (case, punctuation and spaces) and the distinct normalized keys are
+indexed by their trigrams in CSR form, so a fuzzy lookup scores every distinct
+key with one `np.bincount` and never looks at the pairs one by one.
+
+Indices of many documents can be concatenated to pull the same fields from all
+of them at once.
+
+>>> index = FormsIndex.concatenate([doc.forms_index for doc in docs])
+>>> index.get("Date of birth")
+>>> index.extract(["Name", "Date of birth", "Policy number"], threshold=0.6)
+"""
+
+# Standart python libraries
+import re
+
+# 3rd party libraries
+import numpy as np
+
+_separators = re.compile(r"[\W_]+")
+
+
+def normalize_key(key):
+    """Return a key in lower case without punctuation and repeated spaces."""
+    return _separators.sub(" ", key.casefold()).strip()
+
+
+def trigrams(text):
+    """Return the set of trigrams of a normalized key, padded like pg_trgm."""
+    padded = f"  {text} "
+    return {padded[k : k + 3] for k in range(len(padded) - 2)}
+
+
+class FormsIndex:
+    """Key/value pairs of forms with their page, confidence and geometry.
+
+    Parameters
+    ----------
+    pages : array_like
+        page (starting at 0) of every pair
+    keys, values : list
+        text of the key and the value of every pair
+    key_boxes, value_boxes : array_like, optional
+        (n, 4) Left, Top, Width and Height of the keys and values relative to
+        the page, by default NaN
+    key_confidences, value_confidences : array_like, optional
+        confidences of the keys and values, by default NaN
+    documents : array_like, optional
+        document of every pair, by default 0
+    num_documents : int, optional
+        number of documents, documents without pairs count too, by default one
+        more than the last document of a pair (1 without `documents`)
+
+    Attributes
+    ----------
+    key_codes : numpy.ndarray
+        position of the normalized key of every pair in `normalized_keys`
+    normalized_keys : list
+        distinct normalized keys
+    trigram_indptr, trigram_keys : numpy.ndarray
+        codes of the normalized keys that have every trigram, in CSR form
+    key_sizes : numpy.ndarray
+        number of trigrams of every normalized key
+    """
+
+    __slots__ = (
+        "pages",
+        "documents",
+        "num_documents",
+        "keys",
+        "values",
+        "key_boxes",
+        "value_boxes",
+        "key_confidences",
+        "value_confidences",
+        "key_codes",
+        "normalized_keys",
+        "trigram_indptr",
+        "trigram_keys",
+        "key_sizes",
+        "_codes",
+        "_trigram_codes",
+    )
+
+    def __init__(
+        self,
+        pages,
+        keys,
+        values,
+        key_boxes=None,
+        value_boxes=None,
+        key_confidences=None,
+        value_confidences=None,
+        documents=None,
+        num_documents=None,
+    ):
+        num_pairs = len(keys)
+        self.pages = np.asarray(pages, dtype=np.int32)
+        if documents is None:
+            self.documents = np.zeros(num_pairs, dtype=np.int32)
+            self.num_documents = 1 if num_documents is None else num_documents
+        else:
+            self.documents = np.asarray(documents, dtype=np.int32)
+            if num_documents is None:
+                num_documents = int(self.documents.max()) + 1 if num_pairs else 0
+            self.num_documents = num_documents
+        self.keys = list(keys)
+        self.values = list(values)
+        self.key_boxes = self._column(key_boxes, (num_pairs, 4))
+        self.value_boxes = self._column(value_boxes, (num_pairs, 4))
+        self.key_confidences = self._column(key_confidences, num_pairs)
+        self.value_confidences = self._column(value_confidences, num_pairs)
+        self._build_index()
+
+    @staticmethod
+    def _column(values, shape):
+        if values is None:
+            return np.full(shape, np.nan, dtype=np.float32)
+        return np.asarray(values, dtype=np.float32).reshape(shape)
+
+    def _build_index(self):
+        self._codes = {}
+        self.key_codes = np.array(
+            [
+                self._codes.setdefault(normalize_key(key), len(self._codes))
+                for key in self.keys
+            ],
+            dtype=np.int32,
+        )
+        self.normalized_keys = list(self._codes)
+
+        # Trigrams of the distinct keys, transposed to trigram -> keys
+        self._trigram_codes = {}
+        key_trigrams = [
+            [
+                self._trigram_codes.setdefault(trigram, len(self._trigram_codes))
+                for trigram in trigrams(key)
+            ]
+            for key in self.normalized_keys
+        ]
+        self.key_sizes = np.array([len(codes) for codes in key_trigrams], np.int32)
+        codes = np.array(
+            [code for codes in key_trigrams for code in codes], dtype=np.int64
+        )
+        keys = np.repeat(np.arange(len(key_trigrams), dtype=np.int32), self.key_sizes)
+        order = np.argsort(codes, kind="stable")
+        self.trigram_keys = keys[order]
+        self.trigram_indptr = np.zeros(len(self._trigram_codes) + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(codes, minlength=len(self._trigram_codes)),
+            out=self.trigram_indptr[1:],
+        )
+
+    @classmethod
+    def from_pages_forms(cls, pages_forms):
+        """Build an index (without geometry) from the forms of every page."""
+        pages, keys, values = [], [], []
+        for page, forms in enumerate(pages_forms or []):
+            for key, value in (forms or {}).items():
+                pages.append(page)
+                keys.append(key)
+                values.append(value)
+        return cls(pages, keys, values)
+
+    @classmethod
+    def concatenate(cls, indices):
+        """Join the indices of many documents, the document of the pairs of the
+        ith index is i (None indices are skipped but keep their number).
+
+        Every index must be of a single document."""
+        indices = list(indices)
+        parts = [(k, index) for k, index in enumerate(indices) if index is not None]
+
+        def stack(name, shape):
+            return np.concatenate(
+                [np.empty(shape, np.float32)] + [getattr(i, name) for _, i in parts]
+            )
+
+        return cls(
+            np.concatenate([np.empty(0, np.int32)] + [i.pages for _, i in parts]),
+            [key for _, index in parts for key in index.keys],
+            [value for _, index in parts for value in index.values],
+            stack("key_boxes", (0, 4)),
+            stack("value_boxes", (0, 4)),
+            stack("key_confidences", 0),
+            stack("value_confidences", 0),
+            np.concatenate(
+                [np.empty(0, np.int32)]
+                + [np.full(len(index), k, np.int32) for k, index in parts]
+            ),
+            len(indices),
+        )
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __repr__(self):
+        return f"FormsIndex({len(self)} pairs, {len(self.normalized_keys)} keys)"
+
+    def similarities(self, key):
+        """Return the trigram similarity (Jaccard) of a key with every distinct
+        normalized key."""
+        query = trigrams(normalize_key(key))
+        codes = [
+            self._trigram_codes[trigram]
+            for trigram in query
+            if trigram in self._trigram_codes
+        ]
+        postings = [
+            self.trigram_keys[self.trigram_indptr[code] : self.trigram_indptr[code + 1]]
+            for code in codes
+        ]
+        shared = np.bincount(
+            np.concatenate([np.empty(0, np.int32)] + postings),
+            minlength=len(self.normalized_keys),
+        )
+        return shared / (len(query) + self.key_sizes - shared)
+
+    def match(self, key, threshold=None):
+        """Find the pairs of a key.
+
+        Parameters
+        ----------
+        key : str
+            key to look up, it's normalized
+        threshold : float, optional
+            minimum trigram similarity (between 0 and 1) of a fuzzy match, by
+            default only keys equal once normalized match
+
+        Returns
+        -------
+        numpy.ndarray
+            indices of the pairs, best match first and then in document order
+        numpy.ndarray
+            similarity of the key of every pair
+        """
+        if threshold is None:
+            code = self._codes.get(normalize_key(key))
+            if code is None:
+                return np.empty(0, dtype=np.int64), np.empty(0)
+            pairs = np.flatnonzero(self.key_codes == code)
+            return pairs, np.ones(len(pairs))
+
+        scores = self.similarities(key)[self.key_codes]
+        pairs = np.flatnonzero(scores >= threshold)
+        pairs = pairs[np.argsort(-scores[pairs], kind="stable")]
+        return pairs, scores[pairs]
+
+    def get(self, key, default=None, threshold=None):
+        """Return the value of the best match of a key (see `match`)."""
+        pairs, _ = self.match(key, threshold)
+        return self.values[pairs[0]] if len(pairs) else default
+
+    def get_all(self, key, threshold=None):
+        """Return the values of every match of a key (see `match`)."""
+        pairs, _ = self.match(key, threshold)
+        return [self.values[pair] for pair in pairs]
+
+    def pair(self, index):
+        """Return a pair as a dict with its text, page, confidences and boxes."""
+        return {
+            "key": self.keys[index],
+            "value": self.values[index],
+            "page": int(self.pages[index]),
+            "document": int(self.documents[index]),
+            "key_confidence": float(self.key_confidences[index]),
+            "value_confidence": float(self.value_confidences[index]),
+            "key_box": self.key_boxes[index].tolist(),
+            "value_box": self.value_boxes[index].tolist(),
+        }
+
+    def extract(self, fields, threshold=None, default=None):
+        """Pull some fields from every document of the index.
+
+        Parameters
+        ----------
+        fields : list
+            keys to look up
+        threshold : float, optional
+            minimum similarity of a fuzzy match, by default exact matches only
+        default : optional
+            value of the fields a document doesn't have, by default None
+
+        Returns
+        -------
+        list
+            dict field -> value of the best match of the document i at the ith
+            position
+        """
+        results = [dict.fromkeys(fields, default) for _ in range(self.num_documents)]
+        for field in fields:
+            pairs, scores = self.match(field, threshold)
+            # Best match of every document: pairs are already sorted by score
+            documents = self.documents[pairs]
+            order = np.argsort(documents, kind="stable")
+            found, first = np.unique(documents[order], return_index=True)
+            for document, pair in zip(found, pairs[order[first]]):
+                results[document][field] = self.values[pair]
+        return results
@@ -0,0 +1,144 @@
+"""Batcher that groups the asynchronous Vision requests of many documents.
+
+`async_batch_annotate_files` accepts many files in a single request and returns
+a long-running operation. Documents submitted within `window` seconds of each
+other are sent together, one background thread waits for the operation with
+the exponential backoff of `Operation.result` and hands every document the
+response of its own file, so many pdfs wait together without listing the output
+bucket over and over.
+
+>>> batcher = get_batcher(vision_client)
+>>> response = batcher.submit(async_request).result()
+>>> response = await asyncio.wrap_future(batcher.submit(async_request))
+"""
+
+# Standart python libraries
+import threading
+from concurrent.futures import Future
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(vision_client, window=0.5, max_files=100, timeout=3600):
+    """Return the process-wide batcher of a vision client, creating it if needed.
+
+    Parameters
+    ----------
+    vision_client : vision.ImageAnnotatorClient
+        client used to send the requests, only used the first time
+    window : float, optional
+        seconds the first request of a batch waits for others, by default 0.5
+    max_files : int, optional
+        maximum number of files in a request, by default 100
+    timeout : float, optional
+        maximum seconds to wait for an operation, by default 3600
+
+    Returns
+    -------
+    VisionBatcher
+        batcher of the client
+    """
+    with _batchers_lock:
+        key = id(vision_client)
+        if key not in _batchers:
+            _batchers[key] = VisionBatcher(vision_client, window, max_files, timeout)
+        return _batchers[key]
+
+
+class VisionBatcher:
+    """Send the file requests of many documents in shared asynchronous operations.
+
+    Parameters
+    ----------
+    vision_client : vision.ImageAnnotatorClient
+        client used to send the requests
+    window : float, optional
+        seconds the first request of a batch waits for others, by default 0.5
+    max_files : int, optional
+        maximum number of files in a request, a batch is sent as soon as it's
+        full, by default 100
+    timeout : float, optional
+        maximum seconds to wait for an operation, by default 3600
+    """
+
+    def __init__(self, vision_client, window=0.5, max_files=100, timeout=3600):
+        self.vision_client = vision_client
+        self.window = window
+        self.max_files = max_files
+        self.timeout = timeout
+
+        self._pending = []
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def submit(self, request):
+        """Add a file request to the next batch.
+
+        Parameters
+        ----------
+        request : vision.types.AsyncAnnotateFileRequest
+            request of one file
+
+        Returns
+        -------
+        concurrent.futures.Future
+            future with the `AsyncAnnotateFileResponse` of the file, or the error
+            of the operation
+        """
+        future = Future()
+        with self._lock:
+            self._pending.append((request, future))
+            if len(self._pending) >= self.max_files:
+                batch = self._take()
+            else:
+                batch = None
+                if self._timer is None:
+                    self._timer = threading.Timer(self.window, self._flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+
+        if batch:
+            self._start(batch)
+        return future
+
+    def _take(self):
+        # Called with the lock held
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        return batch
+
+    def _flush(self):
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._run(batch)
+
+    def _start(self, batch):
+        thread = threading.Thread(target=self._run, args=(batch,), daemon=True)
+        thread.start()
+
+    def _run(self, batch):
+        # Documents that gave up before the request was sent are left out
+        batch = [
+            (request, future)
+            for request, future in batch
+            if future.set_running_or_notify_cancel()
+        ]
+        if not batch:
+            return
+
+        try:
+            operation = self.vision_client.async_batch_annotate_files(
+                requests=[request for request, _ in batch]
+            )
+            response = operation.result(timeout=self.timeout)
+        except Exception as error:
+            for _, future in batch:
+                future.set_exception(error)
+            return
+
+        for (_, future), file_response in zip(batch, response.responses):
+            future.set_result(file_response)
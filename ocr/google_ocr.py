@@ -1,23 +1,159 @@
 """Modulito."""
 
 # Google
-from google.cloud import vision, storage
+from google.cloud import vision
 from google.cloud.vision import types
 from google.protobuf import json_format
 
 # Utils
+import asyncio
 import os
 import io
+import json
 import math
 import random
+import re
 
 # Credentials
+from .async_utils import run_blocking, run_sync
+from .clients import get_google_clients
+from .google_batcher import get_batcher
 from .ocr_document import Document
 
 CREDENTIALS_LOC = (
     os.path.dirname(os.path.abspath(__file__)) + "/keys/google_credentials.json"
 )
 admitted_extensions = ["pdf", "jpg", "jpeg", "png"]
+# Maximum pages of an output shard accepted by the api
+max_batch_size = 100
+# Vision names the output shards "output-<first page>-to-<last page>.json"
+shard_pages = re.compile(r"output-(\d+)-to-(\d+)\.json$")
+
+
+def _shard_first_page(blob):
+    match = shard_pages.search(blob.name)
+    return int(match.group(1)) if match else 0
+
+
+def _compact_page(response):
+    """Keep the text and the words of a page of a json output shard.
+
+    Parameters
+    ----------
+    response : dict
+        json response of a page (an element of `responses` of the shard)
+
+    Returns
+    -------
+    str
+        text of the page
+    list
+        WORD blocks (textract-like dicts with the normalized bounding box)
+    """
+    annotation = response.get("fullTextAnnotation", {})
+    page_number = response.get("context", {}).get("pageNumber", 1)
+
+    words = []
+    for page in annotation.get("pages", []):
+        for block in page.get("blocks", []):
+            for paragraph in block.get("paragraphs", []):
+                for word in paragraph.get("words", []):
+                    # Coordinates equal to 0 are left out of the json
+                    vertices = word.get("boundingBox", {}).get("normalizedVertices")
+                    xs = [vertex.get("x", 0) for vertex in vertices or [{}]]
+                    ys = [vertex.get("y", 0) for vertex in vertices or [{}]]
+                    words.append(
+                        {
+                            "BlockType": "WORD",
+                            "Id": f"{page_number}-{len(words)}",
+                            "Page": page_number,
+                            "Text": "".join(
+                                symbol.get("text", "")
+                                for symbol in word.get("symbols", [])
+                            ),
+                            "Confidence": 100 * word.get("confidence", 0),
+                            "Geometry": {
+                                "BoundingBox": {
+                                    "Left": min(xs),
+                                    "Top": min(ys),
+                                    "Width": max(xs) - min(xs),
+                                    "Height": max(ys) - min(ys),
+                                }
+                            },
+                        }
+                    )
+    return annotation.get("text", ""), words
+
+
+def auto_batch_size(num_pages, max_downloads=8):
+    """Choose the pages of each output shard of a pdf.
+
+    Shards are as big as possible while there are enough of them to download
+    `max_downloads` at the same time, a 500 pages pdf is split in 8 shards of 63
+    pages instead of 250 shards of 2.
+
+    Parameters
+    ----------
+    num_pages : int
+        number of pages of the pdf
+    max_downloads : int, optional
+        shards downloaded at the same time, by default 8
+
+    Returns
+    -------
+    int
+        pages per shard, between 1 and `max_batch_size`
+    """
+    return max(1, min(max_batch_size, math.ceil(num_pages / max_downloads)))
+
+
+async def read_shards(blobs, compact=False, max_downloads=8):
+    """Download and parse the json output shards of a pdf in page order.
+
+    Parameters
+    ----------
+    blobs : list
+        output blobs of the vision job
+    compact : bool, optional
+        if True keep only the words of every page (see `_compact_page`), by
+        default False
+    max_downloads : int, optional
+        maximum number of shards downloaded at the same time, by default 8
+
+    Returns
+    -------
+    list
+        text of the page i at the ith position
+    list
+        response (protobuf or WORD blocks) of the page i at the ith position
+    """
+
+    def download_shard(blob):
+        json_string = blob.download_as_string()
+        if compact:
+            return [
+                _compact_page(page) for page in json.loads(json_string)["responses"]
+            ]
+        response = json_format.Parse(json_string, vision.types.AnnotateFileResponse())
+        return [(page.full_text_annotation.text, page) for page in response.responses]
+
+    downloads = asyncio.Semaphore(max_downloads)
+
+    async def download(blob):
+        async with downloads:
+            return await run_blocking(download_shard, blob)
+
+    # Shards are listed by name, "output-11-to-12" goes before "output-3-to-4"
+    blobs = sorted(blobs, key=_shard_first_page)
+    shards = await asyncio.gather(*(download(blob) for blob in blobs))
+
+    pages_text = []
+    pages_response = []
+    for shard in shards:
+        for text, page in shard:
+            pages_text.append(text)
+            pages_response.append(page)
+    return pages_text, pages_response
 
 
 class GoogleOcr(Document):
@@ -34,22 +170,44 @@ class GoogleOcr(Document):
         [description]
     """
 
-    def __init__(self, file_path):
+    def __init__(
+        self,
+        file_path,
+        job_timeout=None,
+        compact=False,
+        max_downloads=8,
+        batch_size=None,
+    ):
         """Initialize GoogleVision Class.
         
         Parameters
         ----------
         file_path : str
             path to file
+        job_timeout : float, optional
+            maximum seconds to wait for the vision job of a pdf, by default None
+            (no limit other than the one of the batcher). A job that times out
+            after it was sent keeps running, its output is removed when it ends
+        compact : bool, optional
+            if True `pages_response` of pdfs keeps only the words of every page
+            as textract-like WORD blocks (text, confidence and normalized bounding
+            box) instead of the full protobuf response, by default False
+        max_downloads : int, optional
+            maximum number of output shards downloaded at the same time, by
+            default 8
+        batch_size : int, optional
+            pages of every output shard of a pdf (at most 100), by default None
+            (chosen from the number of pages with `auto_batch_size`)
         """
         super().__init__(file_path)
         self._validate_extension()
+        self.job_timeout = job_timeout
+        self.compact = compact
+        self.max_downloads = max_downloads
+        self.batch_size = batch_size
 
-        # Loads credentials and instanciates client
-        self.vision_client = vision.ImageAnnotatorClient.from_service_account_json(
-            CREDENTIALS_LOC
-        )
-        self.storage_client = storage.Client.from_service_account_json(CREDENTIALS_LOC)
+        # Clients are created once per process and shared, see `clients`
+        self.vision_client, self.storage_client = get_google_clients(CREDENTIALS_LOC)
 
         # Google buckets and paths
         self.bucket_name = "hercules_demos"
@@ -83,12 +241,23 @@ class GoogleOcr(Document):
         return blob.public_url
 
     def pipeline_extraction(self):
+        run_sync(self.apipeline_extraction())
+
+    async def apipeline_extraction(self):
+        """Asynchronous version of `pipeline_extraction`.
+
+        Uploads, downloads and the wait for the vision job don't block the event
+        loop, so many documents can be processed from the same loop.
+        """
         if self.extension == "pdf":
-            self._clear_folder()
-            self._OCR_pdf()
-            self._clear_folder()
+            await run_blocking(self._clear_folder)
+            try:
+                await self._OCR_pdf()
+            finally:
+                # The pdf and the output shards are removed even if the job fails
+                await run_blocking(self._clear_folder)
         else:
-            self._OCR_image()
+            await run_blocking(self._OCR_image)
 
     def _clear_folder(self):
         bucket = self.storage_client.get_bucket(self.bucket_name)
@@ -96,13 +265,16 @@ class GoogleOcr(Document):
         for blob in blobs:
             blob.delete()
 
-    def _OCR_pdf(self, batch_size=2, mime_type="application/pdf"):
+    async def _OCR_pdf(self, batch_size=None, mime_type="application/pdf"):
         """OCR with PDF/TIFF from local file. Return a list with the text of each page.
+
+        It's a coroutine, the blocking calls to google run in the default executor.
         
         Parameters
         ----------
         batch_size : int, optional
-            Number of pdf pages in each batch, by default 2
+            Number of pdf pages in each batch, by default `self.batch_size` or
+            `auto_batch_size`
         mime_type : str, optional
             Supported mime_types are 'application/pdf' and  'image/tiff', by default "application/pdf"
         Notes
@@ -111,25 +283,18 @@ class GoogleOcr(Document):
         the response of google's api
         """
 
-        def wait_for_blob_list():
-            finished = False
-            while not finished:
-                finished = True
-                bucket = self.storage_client.get_bucket(self.bucket_name)
-                blob_list = list(
-                    bucket.list_blobs(prefix=self.blob_path + "proccessed")
-                )
-                if len(blob_list) < math.ceil(self.num_pages / batch_size):
-                    finished = False
-            return blob_list
+        def list_processed_blobs():
+            bucket = self.storage_client.get_bucket(self.bucket_name)
+            return list(bucket.list_blobs(prefix=self.blob_path + "proccessed"))
 
-        if self.num_pages == 1:
-            batch_size = 1
+        if batch_size is None:
+            batch_size = self.batch_size or auto_batch_size(
+                self.num_pages, self.max_downloads
+            )
+        batch_size = min(batch_size, max_batch_size)
 
         # Upload to google storage
-        self._upload_to_bucket()
-        bucket = self.storage_client.get_bucket(self.bucket_name)
-        blob_list = list(bucket.list_blobs(prefix=self.blob_path))
+        await run_blocking(self._upload_to_bucket)
 
         # Origin
         gcs_source_uri = "gs://" + self.bucket_name + "/" + self.blob_name
@@ -164,32 +329,26 @@ class GoogleOcr(Document):
         async_request = vision.types.AsyncAnnotateFileRequest(
             features=[feature], input_config=input_config, output_config=output_config
         )
-        self.vision_client.async_batch_annotate_files(requests=[async_request])
-
-        blob_list = wait_for_blob_list()
+        # The request may share an operation with other documents, the output
+        # shards are listed once the operation is done
+        batcher = get_batcher(self.vision_client)
+        future = batcher.submit(async_request)
+        try:
+            await asyncio.wait_for(asyncio.wrap_future(future), self.job_timeout)
+        except asyncio.TimeoutError:
+            # A request already sent can't be cancelled, the operation would write
+            # its shards after the folder is cleared so it's cleared again then
+            if not future.cancelled():
+                future.add_done_callback(lambda _: self._clear_folder())
+            raise
+        blob_list = await run_blocking(list_processed_blobs)
 
         # Building response #
         # ----------------- #
 
-        self.pages_text = []
-        self.pages_response = []
-        # Iterate over batches
-        for index, blob in enumerate(blob_list):
-            print(index, "/", len(blob_list))
-
-            # Process one batch.
-            json_string = blob.download_as_string()
-            response = json_format.Parse(
-                json_string, vision.types.AnnotateFileResponse()
-            )
-
-            # Iterate over pages in batch
-            for page in response.responses:
-
-                # Response por p page in batch b.
-                self.pages_response.append(page)
-                self.pages_text.append(page.full_text_annotation.text)
-
+        self.pages_text, self.pages_response = await read_shards(
+            blob_list, self.compact, self.max_downloads
+        )
         self.text = " ".join(self.pages_text)
 
     def _OCR_image(self):
@@ -1,20 +1,62 @@
-from .aws_ocr import AwsOcr
-from .tika_ocr import TikaOcr
-from .google_ocr import GoogleOcr
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-actions = {
-    "google": ["ocr_text"],
-    "aws": ["ocr_text", "ocr_tables", "ocr_forms", "ocr_tables_forms"],
-    "tika": ["ocr_text", "text"],
-    "camelot": ["tables"],
-}
+from .async_utils import run_blocking, run_sync
+from .engines import available_engines, get_engine
+from .ocr_document import Document, is_usable_text
+from .page_cache import merge_pages, page_attributes, split_pages
+from .result import OcrResult
+from .spatial_index import SpatialIndex
+from .table import tables_to_csv, tables_to_parquet, tables_to_xlsx
+
+# Engine name -> actions of the built-in engines, the engines are in `engines`
+actions = available_engines(entry_points=False)
+
+result_attributes = [
+    "pages_text",
+    "text",
+    "pages_response",
+    "num_pages",
+    "pages_tables",
+    "forms",
+    "pages_forms",
+    "forms_index",
+    "blocks",
+    "ocr_pages",
+]
+
+
+def _print_aws_notice():
+    print(
+        """Set aws bucket, folder and region using the set functions
+        if not default values (bucket = "ocr-deep-dive", region="us-east-1" 
+        and no folder) will be used to stored the file in s3')"""
+    )
 
 
 class Ocr:
-    def __init__(self, file_path, action, engine):
+    def __init__(self, file_path, action, engine, notice=True):
 
         self.file_path = file_path
-        self.actions = actions
+        self.error = None
+        self.cache = None
+        self.cache_pages = False
+        self.rasterization = {}
+        self.tika_workers = 1
+        self.tesseract_workers = None
+        self.tesseract_lang = "eng"
+        self.google_compact = False
+        self.google_batch_size = None
+        self.camelot_flavor = "auto"
+        self.camelot_workers = None
+        self.min_text_chars = 20
+        self.min_alnum_ratio = 0.6
+        self.ocr_pages = None
+        self.forms_index = None
+        self._result = None
+        self._spatial_index = None
 
         self.engine = engine
         self._validate_engine()
@@ -23,31 +65,99 @@ class Ocr:
         self._validate_engine_action()
 
         if self.engine == "aws":
-            print(
-                """Set aws bucket, folder and region using the set functions
-                if not default values (bucket = "ocr-deep-dive", region="us-east-1" 
-                and no folder) will be used to stored the file in s3')"""
-            )
+            if notice:
+                _print_aws_notice()
 
             self.aws_bucket = "ocr-deep-dive"
             self.aws_folder = None
             self.aws_region = "us-east-1"
+            self.aws_profile = None
+
+    @property
+    def actions(self):
+        return available_engines()
 
     def _validate_engine_action(self):
-        if self.action not in self.actions[self.engine]:
+        if self.action not in self.engine_spec.actions:
             raise Exception(
                 f""" Given action {self.action} can't be used with  
                     {self.engine} engine, the options you have are 
-                    {str(self.actions[self.engine])} """
+                    {str(self.engine_spec.actions)} """
             )
 
     def _validate_engine(self):
-        if self.engine not in self.actions.keys():
+        try:
+            self.engine_spec = get_engine(self.engine)
+        except KeyError:
             raise Exception(
                 f""" Given engine {self.engine} is not an opcion, use one from 
                 {str(self.actions.keys())} """
             )
 
+    @classmethod
+    def process_batch(
+        cls, paths, action, engine, max_workers=8, ordered=True, **settings
+    ):
+        """Process many files at the same time with a bounded pool of workers.
+
+        Most of the time of a document is spent waiting for uploads and OCR jobs,
+        every worker processes a whole document so the uploads, jobs and waits of
+        different documents overlap.
+
+        >>> for doc in Ocr.process_batch(paths, "ocr_text", "aws", ordered=False):
+        ...     print(doc.file_path, doc.error or doc.num_pages)
+
+        Parameters
+        ----------
+        paths : list
+            local paths of the files to process
+        action : str
+            action to perform in every file
+        engine : str
+            engine used to process the files
+        max_workers : int, optional
+            maximum number of documents processed at the same time, by default 8
+        ordered : bool, optional
+            if True return a list in the same order as `paths`, if False return a
+            generator that yields each document as soon as it's finished,
+            by default True
+        settings : dict
+            engine settings applied to every document (`aws_bucket`, `aws_folder`,
+            `aws_region`, `aws_profile`)
+
+        Returns
+        -------
+        list or generator
+            processed `Ocr` objects, if the processing of a document fails its
+            exception is kept in the `error` attribute and the rest go on
+        """
+        # The aws notice is printed once for the batch, and only without settings
+        docs = [cls(path, action, engine, notice=False) for path in paths]
+        if engine == "aws" and not settings:
+            _print_aws_notice()
+        for doc in docs:
+            for setting, value in settings.items():
+                setattr(doc, setting, value)
+
+        def process(doc):
+            try:
+                doc.process_file()
+            except Exception as error:
+                doc.error = error
+            return doc
+
+        if ordered:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                return list(executor.map(process, docs))
+
+        def iterate():
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(process, doc) for doc in docs]
+                for future in as_completed(futures):
+                    yield future.result()
+
+        return iterate()
+
     def set_aws_folder(self, folder):
         self.aws_folder = folder
 
@@ -57,41 +167,308 @@ class Ocr:
     def set_aws_region(self, region):
         self.aws_region = region
 
+    def set_aws_profile(self, profile):
+        """Set the aws profile with the credentials, None uses the default ones."""
+        self.aws_profile = profile
+
+    def set_tika_workers(self, workers):
+        """Set the number of pages OCR'd in parallel by a pool of tika servers."""
+        self.tika_workers = workers
+
+    def set_tesseract_workers(self, workers):
+        """Set the number of tesseract processes, by default one per core."""
+        self.tesseract_workers = workers
+
+    def set_tesseract_lang(self, lang):
+        """Set the tesseract language(s), "eng" or "spa+eng" for example."""
+        self.tesseract_lang = lang
+
+    def set_google_compact(self, compact):
+        """Keep only the words of every page (textract-like WORD blocks) in
+        `pages_response` of google instead of the full protobuf responses."""
+        self.google_compact = compact
+
+    def set_google_batch_size(self, batch_size):
+        """Set the pages of every output shard of google (at most 100), None
+        chooses it from the number of pages of the pdf."""
+        self.google_batch_size = batch_size
+
+    def set_camelot_flavor(self, flavor):
+        """Set the camelot flavor, "lattice", "stream" or "auto" (chosen per page
+        from the lines drawn in it)."""
+        self.camelot_flavor = flavor
+
+    def set_camelot_workers(self, workers):
+        """Set the number of processes that read pages with camelot, by default
+        one per core."""
+        self.camelot_workers = workers
+
+    def set_min_text_chars(self, min_chars, min_alnum_ratio=None):
+        """Set the characters a page needs in its text layer to skip the OCR with
+        the `auto` action, and optionally the share of them that must be letters
+        or digits (see `is_usable_text`)."""
+        self.min_text_chars = min_chars
+        if min_alnum_ratio is not None:
+            self.min_alnum_ratio = min_alnum_ratio
+
+    def set_rasterization(self, **options):
+        """Set how pdf pages are rendered before doing OCR with tika or tesseract.
+
+        Parameters
+        ----------
+        options : dict
+            `dpi`, `fmt`, `grayscale`, `thread_count` and `chunk_size` as in
+            `Document.iter_rasterized_pages`
+        """
+        self.rasterization = options
+
+    def set_cache(self, cache, per_page=False):
+        """Use a `ResultCache` to reuse the results of files already processed.
+
+        The cache is consulted before uploading anything to the engine.
+
+        Parameters
+        ----------
+        cache : ResultCache
+            cache shared by the documents, None to stop using it
+        per_page : bool, optional
+            if True the results of each page of a pdf are cached on their own and
+            only the pages that aren't in the cache are sent to the engine (the
+            `auto` action caches whole files), by default False
+        """
+        self.cache = cache
+        self.cache_pages = per_page
+
+    def _engine_params(self):
+        """Settings of the engine that change its results, they are part of the
+        cache key."""
+        if self.engine == "tika" and self.action != "text":
+            params = dict(self.rasterization)
+        elif self.engine == "tesseract":
+            params = dict(self.rasterization, lang=self.tesseract_lang)
+        elif self.engine == "google":
+            params = {"compact": self.google_compact}
+        elif self.engine == "camelot":
+            params = {"flavor": self.camelot_flavor}
+        else:
+            params = {}
+        if self.action == "auto":
+            params["min_text_chars"] = self.min_text_chars
+            params["min_alnum_ratio"] = self.min_alnum_ratio
+        return params
+
     def process_file(self):
-        def _add_atributes(list_attributes):
-            for attribute in list_attributes:
-                val = (
-                    getattr(self.Engine, attribute)
-                    if attribute in dir(self.Engine)
-                    else None
-                )
-                setattr(self, attribute, val)
+        run_sync(self.aprocess_file())
 
-        if self.engine == "aws":
-            self.Engine = AwsOcr(
+    async def aprocess_file(self):
+        """Asynchronous version of `process_file`.
+
+        >>> docs = [Ocr(path, "ocr_text", "aws") for path in paths]
+        >>> await asyncio.gather(*(doc.aprocess_file() for doc in docs))
+        """
+        self._result = None
+        self._spatial_index = None
+        if (
+            self.cache is not None
+            and self.cache_pages
+            and self.action != "auto"
+            and self._is_pdf()
+        ):
+            await self._aprocess_pages()
+            return
+
+        if self.cache is not None:
+            key = await run_blocking(
+                self.cache.key,
                 self.file_path,
+                self.engine,
                 self.action,
-                self.aws_bucket,
-                self.aws_folder,
-                self.aws_region,
+                **self._engine_params(),
+            )
+            results = await run_blocking(self.cache.get, key)
+            if results is not None:
+                self.Engine = None
+                for attribute, val in results.items():
+                    setattr(self, attribute, val)
+                return
+
+        if self.action == "auto" and self._is_pdf():
+            await self._aprocess_auto()
+        else:
+            self.Engine = await run_blocking(self._build_engine)
+            await self.Engine.apipeline_extraction()
+
+            self._add_atributes(result_attributes)
+
+        if self.cache is not None:
+            results = {
+                attribute: getattr(self, attribute) for attribute in result_attributes
+            }
+            await run_blocking(self.cache.put, key, results)
+
+    @property
+    def result(self):
+        """`OcrResult` with the results in the same shape for every engine, it's
+        built the first time it's used."""
+        if self._result is None:
+            attributes = {
+                attribute: getattr(self, attribute, None)
+                for attribute in result_attributes
+            }
+            self._result = OcrResult.from_attributes(
+                attributes, self.engine, self.action
             )
-        if self.engine == "tika":
-            ocr = True if "ocr" in self.action else False
-            self.Engine = TikaOcr(self.file_path, ocr)
-        if self.engine == "google":
-            self.Engine = GoogleOcr(self.file_path)
-
-        self.Engine.pipeline_extraction()
-
-        list_attributes = [
-            "pages_text",
-            "text",
-            "pages_response",
-            "num_pages",
-            "pages_tables",
-            "forms",
-            "blocks",
+        return self._result
+
+    @property
+    def spatial_index(self):
+        """`SpatialIndex` over the words of the pages for region, nearest-label and
+        reading-order queries, built the first time it's used."""
+        if self._spatial_index is None:
+            self._spatial_index = SpatialIndex(self.result)
+        return self._spatial_index
+
+    def export_tables(self, file_path, **options):
+        """Write every table of the document to a xlsx (one sheet per table),
+        parquet or csv (one row per cell) file, chosen from the extension."""
+        extension = file_path.split(".")[-1]
+        exporters = {
+            "xlsx": tables_to_xlsx,
+            "parquet": tables_to_parquet,
+            "csv": tables_to_csv,
+        }
+        if extension not in exporters:
+            raise Exception(f"Tables can't be exported to {extension} files")
+        exporters[extension](self.pages_tables, file_path, **options)
+
+    def _is_pdf(self):
+        return self.file_path.split(".")[-1] == "pdf"
+
+    async def _aprocess_pages(self):
+        """Process a pdf page by page with the cache, only new pages are OCR'd."""
+        document = await run_blocking(Document, self.file_path)
+        fingerprints = await run_blocking(document.page_fingerprints)
+        params = dict(self._engine_params(), unit="page")
+        keys = [
+            self.cache.content_key(fingerprint, self.engine, self.action, **params)
+            for fingerprint in fingerprints
         ]
 
-        _add_atributes(list_attributes)
+        pages = [await run_blocking(self.cache.get, key) for key in keys]
+        missing = [k for k, page in enumerate(pages) if page is None]
+
+        self.Engine = None
+        if missing:
+            results = await self._aprocess_subset(document, missing)
+            for k, page in zip(missing, results):
+                pages[k] = page
+                await run_blocking(self.cache.put, keys[k], page)
+
+        for attribute in result_attributes:
+            setattr(self, attribute, None)
+        for attribute, val in merge_pages(pages).items():
+            setattr(self, attribute, val)
+
+    async def _aprocess_auto(self):
+        """Take the pages of a pdf with a text layer as they are and OCR the rest.
+
+        The text layer is read with PyPDF2, the pages it can't decode are read
+        again with tika (`extract_text_layer`). A page is OCR'd when its text
+        layer has less than `min_text_chars` characters (other than spaces) or
+        still looks like undecoded glyphs (less than `min_alnum_ratio` letters
+        and digits, see `is_usable_text`), the indices of those pages are kept
+        in `ocr_pages`. Pages that aren't OCR'd only have `pages_text`, their
+        other per page results are None.
+        """
+        document = await run_blocking(Document, self.file_path)
+        texts = await run_blocking(document.pages_text_layer)
+        texts = await self._decode_text_layer(document, texts)
+        missing = [
+            k
+            for k, text in enumerate(texts)
+            if not is_usable_text(text, self.min_text_chars, self.min_alnum_ratio)
+        ]
+        pages = [{"pages_text": text} for text in texts]
+
+        self.Engine = None
+        if missing:
+            results = await self._aprocess_subset(document, missing)
+            for k, page in zip(missing, results):
+                pages[k] = page
+            for attribute in results[0]:
+                for page in pages:
+                    page.setdefault(attribute, None)
+
+        for attribute in result_attributes:
+            setattr(self, attribute, None)
+        for attribute, val in merge_pages(pages).items():
+            setattr(self, attribute, val)
+        self.ocr_pages = missing
+
+    async def _decode_text_layer(self, document, texts):
+        """Read with tika the pages whose PyPDF2 text isn't usable.
+
+        Scanned pages have no text for tika either, but pages with fonts PyPDF2
+        can't decode are recovered instead of being sent to the OCR engine. If
+        tika isn't available the PyPDF2 text is kept.
+        """
+        undecoded = [
+            k
+            for k, text in enumerate(texts)
+            if "".join(text.split())
+            and not is_usable_text(text, self.min_text_chars, self.min_alnum_ratio)
+        ]
+        if not undecoded:
+            return texts
+        try:
+            from .tika_ocr import extract_text_layer
+
+            decoded = await run_blocking(extract_text_layer, document, undecoded)
+        except Exception as error:
+            print(f"Tika couldn't read the text layer, pages will be OCR'd: {error}")
+            return texts
+
+        texts = list(texts)
+        for k, text in zip(undecoded, decoded):
+            texts[k] = text
+        return texts
+
+    async def _aprocess_subset(self, document, pages):
+        """Send some pages of a pdf to the engine as a new pdf.
+
+        Parameters
+        ----------
+        document : Document
+            pdf being processed
+        pages : list
+            indices (starting at 0) of the pages to process
+
+        Returns
+        -------
+        list
+            dict with the per page results of the page pages[i] at the ith position
+        """
+        folder = tempfile.mkdtemp()
+        file_path = os.path.join(folder, document.filename)
+        try:
+            await run_blocking(document.write_pages, pages, file_path)
+            self.Engine = await run_blocking(self._build_engine, file_path)
+            await self.Engine.apipeline_extraction()
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+        results = {
+            attribute: getattr(self.Engine, attribute, None)
+            for attribute in page_attributes
+        }
+        return split_pages(results, len(pages))
+
+    def _build_engine(self, file_path=None):
+        file_path = self.file_path if file_path is None else file_path
+        # With `auto` the engine only sees the pages that need OCR
+        action = "ocr_text" if self.action == "auto" else self.action
+        return self.engine_spec.create(self, file_path, action)
 
+    def _add_atributes(self, list_attributes):
+        for attribute in list_attributes:
+            setattr(self, attribute, getattr(self.Engine, attribute, None))
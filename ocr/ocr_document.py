@@ -1,9 +1,38 @@
+import hashlib
+import io
 import subprocess
+import tempfile
 from pdf2image import convert_from_path
 from PyPDF2 import PdfFileWriter, PdfFileReader
 from pathlib import Path
 
 
+def is_usable_text(text, min_chars=20, min_alnum_ratio=0.6):
+    """Return True if the text layer of a page can be used instead of OCR.
+
+    Fonts without a unicode map are extracted as glyph codes ("\\x01<\\n\\x01:")
+    that have enough characters but no words, so besides `min_chars` characters
+    (other than spaces) the text needs a share of letters and digits and at least
+    one word.
+
+    Parameters
+    ----------
+    text : str
+        text layer of the page
+    min_chars : int, optional
+        minimum characters other than spaces, by default 20
+    min_alnum_ratio : float, optional
+        minimum share of letters and digits among those characters, by default
+        0.6
+    """
+    chars = "".join(text.split())
+    if len(chars) < min_chars:
+        return False
+    alnum = sum(char.isalnum() for char in chars)
+    has_word = any(sum(char.isalpha() for char in token) >= 2 for token in text.split())
+    return alnum >= min_alnum_ratio * len(chars) and has_word
+
+
 class Document:
     def __init__(self, file_path):
         self.file_path = file_path
@@ -22,32 +51,163 @@ class Document:
         """Open current file."""
         subprocess.call(["open", self.file_path])
 
-    def _pdf_to_jpg(self, folder="img/"):
-        pages = convert_from_path(self.file_path, 500)
-        for k, page in enumerate(pages):
-            page.save(self.img_folder + "/" + str(k) + ".jpg")
-        return len(pages)
+    def iter_rasterized_pages(
+        self, dpi=300, fmt="jpeg", grayscale=False, thread_count=1, chunk_size=4
+    ):
+        """Render the pages of the pdf as images, a few pages at a time.
+
+        Only `chunk_size` pages are held in memory, each one can be sent to the
+        OCR engine before the next chunk is rendered.
+
+        Parameters
+        ----------
+        dpi : int, optional
+            resolution of the images, by default 300
+        fmt : str, optional
+            format used by poppler to render ("jpeg", "png", "tiff" or "ppm"), by
+            default "jpeg"
+        grayscale : bool, optional
+            render in grayscale (smaller images, usually as good for OCR), by
+            default False
+        thread_count : int, optional
+            poppler processes used to render each chunk, by default 1
+        chunk_size : int, optional
+            number of pages rendered at the same time, by default 4
+
+        Yields
+        ------
+        PIL.Image
+            image of the page i, in order
+        """
+        for first_page in range(1, self.num_pages + 1, chunk_size):
+            last_page = min(first_page + chunk_size - 1, self.num_pages)
+            pages = convert_from_path(
+                self.file_path,
+                dpi,
+                first_page=first_page,
+                last_page=last_page,
+                fmt=fmt,
+                grayscale=grayscale,
+                thread_count=thread_count,
+            )
+            while pages:
+                yield pages.pop(0)
 
     def _get_num_pages(self):
         if self.extension == 'pdf':
-            return PdfFileReader(open(self.file_path, "rb")).numPages
+            with open(self.file_path, "rb") as f:
+                return PdfFileReader(f).numPages
         else:
             return 1
 
-    def split_pdf_in_pages(self):
+    def split_pdf_in_pages(self, folder=None):
+        """Write every page of the pdf in its own file.
+
+        Prefer `iter_pages`, that keeps the pages in memory. This is the fallback
+        for tools that can only read files, remove the folder when you are done.
+
+        Parameters
+        ----------
+        folder : str, optional
+            folder where the pages are written, by default a new temporary folder
+            so two documents with the same name never collide
+
+        Returns
+        -------
+        int
+            number of pages
+        str
+            folder with the pages ("000.pdf", "001.pdf"...)
+        """
         def add_ceros(num, total):
             return '0'*(len(total) - len(num)) + num
-        
-        folder = f'{self.name}/'
 
-        Path(folder).mkdir(parents=True, exist_ok=True)
-        inputpdf = PdfFileReader(open(self.file_path, "rb"))
-        for page in range(inputpdf.numPages):
-            output = PdfFileWriter()
-            output.addPage(inputpdf.getPage(page))
+        if folder is None:
+            folder = tempfile.mkdtemp(prefix=f"{self.name}_") + "/"
+        else:
+            Path(folder).mkdir(parents=True, exist_ok=True)
 
-            num_page = add_ceros(str(page), str(inputpdf.numPages))
+        num_pages = 0
+        for page, data in enumerate(self.iter_pages()):
+            num_page = add_ceros(str(page), str(self.num_pages))
             with open(f'{folder}{num_page}.pdf', "wb") as outputStream:
+                outputStream.write(data)
+            num_pages += 1
+
+        return num_pages, folder
+
+    def page_fingerprints(self):
+        """Return the SHA-256 of every page of the document.
+
+        Each page is written as a standalone pdf and hashed, so a page keeps its
+        fingerprint when other pages of the document are changed, added or removed.
+        Images have a single page with the hash of the file.
+
+        Returns
+        -------
+        list
+            hex digest of the page i at the ith position
+        """
+        if self.extension != "pdf":
+            with open(self.file_path, "rb") as f:
+                return [hashlib.sha256(f.read()).hexdigest()]
+
+        return [hashlib.sha256(page).hexdigest() for page in self.iter_pages()]
+
+    def iter_pages(self):
+        """Yield every page of the pdf as the bytes of a standalone pdf.
+
+        Pages are written in memory one at a time from a single open reader.
+
+        Yields
+        ------
+        bytes
+            pdf with the page i, in order
+        """
+        with open(self.file_path, "rb") as f:
+            inputpdf = PdfFileReader(f)
+            for page in range(inputpdf.numPages):
+                output = PdfFileWriter()
+                output.addPage(inputpdf.getPage(page))
+                buffer = io.BytesIO()
+                output.write(buffer)
+                yield buffer.getvalue()
+
+    def write_pages(self, pages, file_path):
+        """Write a pdf with a subset of the pages of the document.
+
+        Parameters
+        ----------
+        pages : list
+            indices (starting at 0) of the pages, in the order they will be written
+        file_path : str
+            path of the new pdf
+        """
+        with open(self.file_path, "rb") as f:
+            inputpdf = PdfFileReader(f)
+            output = PdfFileWriter()
+            for page in pages:
+                output.addPage(inputpdf.getPage(page))
+            with open(file_path, "wb") as outputStream:
                 output.write(outputStream)
 
-        return inputpdf.numPages, folder
+    def pages_text_layer(self):
+        """Return the text embedded in every page of the pdf, without OCR.
+
+        Scanned pages have no text layer (or only a few stray characters), pages
+        whose text can't be decoded are returned empty.
+
+        Returns
+        -------
+        list
+            text of the page i at the ith position
+        """
+        texts = []
+        with open(self.file_path, "rb") as f:
+            inputpdf = PdfFileReader(f)
+            for page in range(inputpdf.numPages):
+                try:
+                    texts.append(inputpdf.getPage(page).extractText())
+                except Exception:
+                    texts.append("")
+        return texts
@@ -0,0 +1,92 @@
+"""Split OCR results of a document per page and merge them back.
+
+Used by the `Ocr` facade to cache the results of every page of a pdf on its own,
+when a document comes back with some pages changed or appended only those pages
+are sent to the engine and the rest are taken from the cache.
+
+>>> pages = split_pages(results, num_pages)
+>>> results = merge_pages(pages)
+"""
+
+# Own
+from .forms_index import FormsIndex
+
+page_attributes = ["pages_text", "pages_response", "pages_tables", "pages_forms"]
+
+
+def _renumber(val, page):
+    # BlockLists are compacted so a page never drags the store of its document
+    return val.compact(page=page) if hasattr(val, "compact") else val
+
+
+def split_pages(results, num_pages):
+    """Split the per page attributes of the results of a document.
+
+    Parameters
+    ----------
+    results : dict
+        attribute name -> value of the results of a document
+    num_pages : int
+        number of pages of the document
+
+    Returns
+    -------
+    list
+        dict with the results of the page i at the ith position
+
+    Raises
+    ------
+    Exception
+        If the results of an attribute don't have one value per page, or there
+        are no per page results at all, so pages are never cached incomplete.
+    """
+    pages = [{} for _ in range(num_pages)]
+    for attribute in page_attributes:
+        values = results.get(attribute)
+        # Engines leave None or [] in the results they don't compute
+        if values is None or (num_pages and len(values) == 0):
+            continue
+        if len(values) != num_pages:
+            raise Exception(
+                f"The engine returned {attribute} for {len(values)} pages "
+                f"instead of {num_pages}"
+            )
+        for page, val in zip(pages, values):
+            page[attribute] = _renumber(val, 1)
+    if num_pages and not pages[0]:
+        raise Exception("The engine didn't return results per page")
+    return pages
+
+
+def merge_pages(pages):
+    """Merge the results of single pages in the results of a document.
+
+    Parameters
+    ----------
+    pages : list
+        dict with the results of the page i at the ith position
+
+    Returns
+    -------
+    dict
+        attribute name -> value of the results of the document
+    """
+    results = {"num_pages": len(pages)}
+    for attribute in page_attributes:
+        if pages and all(attribute in page for page in pages):
+            results[attribute] = [
+                _renumber(page[attribute], k + 1) for k, page in enumerate(pages)
+            ]
+
+    if "pages_text" in results:
+        results["text"] = " ".join(results["pages_text"])
+    if "pages_forms" in results:
+        results["forms"] = {
+            key: val
+            for page_forms in results["pages_forms"]
+            if page_forms is not None
+            for key, val in page_forms.items()
+        }
+        # The geometry of the pairs isn't kept per page
+        results["forms_index"] = FormsIndex.from_pages_forms(results["pages_forms"])
+    return results
@@ -0,0 +1,383 @@
+"""Engine independent OCR results backed by NumPy arrays.
+
+Every engine returns its results in its own shape: textract blocks, vision
+protobufs, strings from tika or dicts of tables and forms. `OcrResult` keeps the
+same information for all of them in a fixed set of flat arrays: the text of the
+pages, the words with their page, normalized box and confidence, the cells of the
+tables and the key/value pairs of the forms. Strings are stored as UTF-8 bytes
+with offsets, like the columns of a `BlockStore`.
+
+A result is saved as a folder of .npy files that are memory-mapped when loaded,
+so a consumer reads only the pages or words it uses and never parses json or
+protobuf.
+
+>>> result = OcrResult.from_attributes(doc.__dict__, "aws", "ocr_tables")
+>>> result.save("results/invoice")
+>>> result = OcrResult.load("results/invoice")
+>>> result.page_text(0), result.words(page=0)
+"""
+
+# Standart python libraries
+import json
+import os
+
+# 3rd party libraries
+import numpy as np
+
+# Own
+from .table import Table, iter_tables
+
+array_names = (
+    "page_offsets",
+    "page_data",
+    "text_data",
+    "word_pages",
+    "word_boxes",
+    "word_confidences",
+    "word_offsets",
+    "word_data",
+    "table_pages",
+    "cell_tables",
+    "cell_rows",
+    "cell_columns",
+    "cell_offsets",
+    "cell_data",
+    "merged_tables",
+    "merged_regions",
+    "form_pages",
+    "key_offsets",
+    "key_data",
+    "value_offsets",
+    "value_data",
+)
+meta_file = "meta.json"
+
+
+def _encode(strings):
+    """Return the offsets (int64) and the UTF-8 bytes (uint8) of some strings."""
+    encoded = [string.encode() for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(string) for string in encoded], out=offsets[1:])
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return offsets, data
+
+
+def _decode(offsets, data, index):
+    return bytes(data[offsets[index] : offsets[index + 1]]).decode()
+
+
+def _box_from_vertices(vertices, width=1, height=1):
+    xs = [vertex.x / width for vertex in vertices] or [0]
+    ys = [vertex.y / height for vertex in vertices] or [0]
+    return min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys)
+
+
+def _page_words(response):
+    """Return the words of a page response.
+
+    Parameters
+    ----------
+    response : BlockList, list or protobuf
+        blocks of textract (or WORD blocks of tesseract and compact google) or
+        the response of google vision of a page
+
+    Returns
+    -------
+    list
+        text of the words
+    numpy.ndarray
+        (n, 4) boxes of the words
+    numpy.ndarray
+        confidences of the words
+    """
+    if response is None:
+        return [], np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.float32)
+
+    if hasattr(response, "store"):
+        # BlockList: the words are taken from the columns of the store
+        store = response.store
+        indices = response.indices[
+            store.types[response.indices] == store.type_code("WORD")
+        ]
+        texts = [store.text(index) for index in indices]
+        return texts, store.boxes[indices], store.confidences[indices]
+
+    texts, boxes, confidences = [], [], []
+    if hasattr(response, "full_text_annotation"):
+        for page in response.full_text_annotation.pages:
+            for block in page.blocks:
+                for paragraph in block.paragraphs:
+                    for word in paragraph.words:
+                        box = word.bounding_box
+                        if box.normalized_vertices:
+                            boxes.append(_box_from_vertices(box.normalized_vertices))
+                        else:
+                            boxes.append(
+                                _box_from_vertices(
+                                    box.vertices, page.width or 1, page.height or 1
+                                )
+                            )
+                        texts.append("".join(symbol.text for symbol in word.symbols))
+                        confidences.append(100 * word.confidence)
+    else:
+        for block in response:
+            if block.get("BlockType") != "WORD":
+                continue
+            box = block.get("Geometry", {}).get("BoundingBox")
+            if box:
+                boxes.append((box["Left"], box["Top"], box["Width"], box["Height"]))
+            else:
+                boxes.append((np.nan,) * 4)
+            texts.append(block.get("Text", ""))
+            confidences.append(block.get("Confidence", np.nan))
+
+    boxes = np.array(boxes, dtype=np.float32).reshape(-1, 4)
+    return texts, boxes, np.array(confidences, dtype=np.float32)
+
+
+class OcrResult:
+    """Results of a document in flat arrays, the same for every engine.
+
+    Pages are the positions in `pages_text` (starting at 0), the boxes are the
+    Left, Top, Width and Height of the words relative to the size of the page.
+
+    Attributes
+    ----------
+    engine : str
+        engine that produced the results
+    action : str
+        action performed on the document
+    num_pages : int
+        number of pages of the document
+    page_offsets, page_data : numpy.ndarray
+        text of every page
+    text_data : numpy.ndarray
+        full text of the document as given by the engine
+    word_pages : numpy.ndarray
+        page of every word (int32)
+    word_boxes : numpy.ndarray
+        (n, 4) float32 array with the box of every word
+    word_confidences : numpy.ndarray
+        confidence of every word between 0 and 100 (float32, NaN if unknown)
+    word_offsets, word_data : numpy.ndarray
+        text of every word
+    table_pages : numpy.ndarray
+        page of every table (int32)
+    cell_tables, cell_rows, cell_columns : numpy.ndarray
+        table, row and column (starting at 1) of every cell (int32)
+    cell_offsets, cell_data : numpy.ndarray
+        text of every cell
+    merged_tables : numpy.ndarray
+        table of every merged region (int32)
+    merged_regions : numpy.ndarray
+        (n, 4) int32 array with the row, column, row span and column span of
+        every merged region
+    form_pages : numpy.ndarray
+        page of every key/value pair of the forms (int32)
+    key_offsets, key_data, value_offsets, value_data : numpy.ndarray
+        text of the keys and the values of the forms
+    """
+
+    __slots__ = ("engine", "action", "num_pages") + array_names
+
+    def __init__(self, engine=None, action=None, num_pages=0, **arrays):
+        self.engine = engine
+        self.action = action
+        self.num_pages = num_pages
+        for name in array_names:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def from_attributes(cls, attributes, engine=None, action=None):
+        """Build the result from the attributes of an engine or an `Ocr` document.
+
+        Parameters
+        ----------
+        attributes : dict
+            `pages_text`, `text`, `pages_response`, `pages_tables` and
+            `pages_forms`, the missing ones (or None) are left empty
+        engine : str, optional
+            engine that produced the results
+        action : str, optional
+            action performed on the document
+
+        Returns
+        -------
+        OcrResult
+            result with the same information
+        """
+        pages_text = attributes.get("pages_text") or []
+        text = attributes.get("text")
+        num_pages = attributes.get("num_pages") or len(pages_text)
+        arrays = {}
+
+        arrays["page_offsets"], arrays["page_data"] = _encode(pages_text)
+        _, arrays["text_data"] = _encode([text if text is not None else ""])
+
+        pages = [_page_words(page) for page in attributes.get("pages_response") or []]
+        texts = [text for page_texts, _, _ in pages for text in page_texts]
+        arrays["word_pages"] = np.repeat(
+            np.arange(len(pages), dtype=np.int32),
+            [len(page_texts) for page_texts, _, _ in pages],
+        )
+        arrays["word_boxes"] = np.concatenate(
+            [np.empty((0, 4), dtype=np.float32)] + [boxes for _, boxes, _ in pages]
+        )
+        arrays["word_confidences"] = np.concatenate(
+            [np.empty(0, dtype=np.float32)] + [conf for _, _, conf in pages]
+        )
+        arrays["word_offsets"], arrays["word_data"] = _encode(texts)
+
+        table_pages, cell_tables, rows, columns, texts = [], [], [], [], []
+        merged_tables, merged = [], []
+        for page, table in iter_tables(attributes.get("pages_tables")):
+            cell_tables.append(np.full(len(table.rows), len(table_pages), np.int32))
+            rows.append(table.rows)
+            columns.append(table.columns)
+            texts.extend(table.texts)
+            merged_tables.append(np.full(len(table.merged), len(table_pages), np.int32))
+            merged.append(table.merged)
+            table_pages.append(page - 1)
+        empty = np.empty(0, dtype=np.int32)
+        arrays["table_pages"] = np.array(table_pages, dtype=np.int32)
+        arrays["cell_tables"] = np.concatenate([empty] + cell_tables)
+        arrays["cell_rows"] = np.concatenate([empty] + rows)
+        arrays["cell_columns"] = np.concatenate([empty] + columns)
+        arrays["cell_offsets"], arrays["cell_data"] = _encode(texts)
+        arrays["merged_tables"] = np.concatenate([empty] + merged_tables)
+        arrays["merged_regions"] = np.concatenate(
+            [np.empty((0, 4), dtype=np.int32)] + merged
+        )
+
+        form_pages, keys, values = [], [], []
+        for page, forms in enumerate(attributes.get("pages_forms") or []):
+            for key, value in (forms or {}).items():
+                form_pages.append(page)
+                keys.append(key)
+                values.append(value)
+        arrays["form_pages"] = np.array(form_pages, dtype=np.int32)
+        arrays["key_offsets"], arrays["key_data"] = _encode(keys)
+        arrays["value_offsets"], arrays["value_data"] = _encode(values)
+
+        return cls(engine, action, num_pages, **arrays)
+
+    def page_text(self, page):
+        """Return the text of a page."""
+        return _decode(self.page_offsets, self.page_data, page)
+
+    @property
+    def pages_text(self):
+        return [self.page_text(page) for page in range(len(self.page_offsets) - 1)]
+
+    @property
+    def text(self):
+        return bytes(self.text_data).decode()
+
+    def words(self, page=None):
+        """Return the words of the document or of one page.
+
+        Parameters
+        ----------
+        page : int, optional
+            page of the words, by default every page
+
+        Returns
+        -------
+        list
+            text of the words
+        numpy.ndarray
+            (n, 4) boxes of the words
+        numpy.ndarray
+            confidences of the words
+        """
+        if page is None:
+            indices = np.arange(len(self.word_pages))
+        else:
+            indices = np.flatnonzero(self.word_pages == page)
+        texts = [_decode(self.word_offsets, self.word_data, k) for k in indices]
+        return texts, self.word_boxes[indices], self.word_confidences[indices]
+
+    @property
+    def pages_tables(self):
+        pages_tables = [[] for _ in range(self.num_pages)]
+        # The cells of every table are contiguous
+        tables = np.arange(len(self.table_pages) + 1)
+        bounds = np.searchsorted(self.cell_tables, tables)
+        merged_bounds = np.searchsorted(self.merged_tables, tables)
+        for k, page in enumerate(self.table_pages):
+            start, end = bounds[k], bounds[k + 1]
+            texts = [
+                _decode(self.cell_offsets, self.cell_data, cell)
+                for cell in range(start, end)
+            ]
+            merged = self.merged_regions[merged_bounds[k] : merged_bounds[k + 1]]
+            pages_tables[page].append(
+                Table(
+                    self.cell_rows[start:end],
+                    self.cell_columns[start:end],
+                    texts,
+                    merged,
+                )
+            )
+        return pages_tables
+
+    @property
+    def pages_forms(self):
+        pages_forms = [{} for _ in range(self.num_pages)]
+        for k, page in enumerate(self.form_pages):
+            key = _decode(self.key_offsets, self.key_data, k)
+            pages_forms[page][key] = _decode(self.value_offsets, self.value_data, k)
+        return pages_forms
+
+    @property
+    def forms(self):
+        return {
+            key: value
+            for page_forms in self.pages_forms
+            for key, value in page_forms.items()
+        }
+
+    def save(self, folder):
+        """Save the result in a folder, one .npy file per array.
+
+        Parameters
+        ----------
+        folder : str
+            folder of the result, it's created if it doesn't exist
+        """
+        os.makedirs(folder, exist_ok=True)
+        for name in array_names:
+            np.save(os.path.join(folder, name + ".npy"), getattr(self, name))
+        meta = {
+            "engine": self.engine,
+            "action": self.action,
+            "num_pages": self.num_pages,
+        }
+        with open(os.path.join(folder, meta_file), "w") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, folder, mmap=True):
+        """Load a result saved with `save`.
+
+        Parameters
+        ----------
+        folder : str
+            folder of the result
+        mmap : bool, optional
+            if True the arrays are memory-mapped (read only) instead of read,
+            by default True
+
+        Returns
+        -------
+        OcrResult
+            loaded result
+        """
+        with open(os.path.join(folder, meta_file)) as f:
+            meta = json.load(f)
+        mmap_mode = "r" if mmap else None
+        arrays = {
+            name: np.load(os.path.join(folder, name + ".npy"), mmap_mode=mmap_mode)
+            for name in array_names
+        }
+        return cls(meta["engine"], meta["action"], meta["num_pages"], **arrays)
@@ -0,0 +1,333 @@
+"""Spatial index over the words of a document for region and layout queries.
+
+The words of every page (text, normalized box and confidence, taken from an
+`OcrResult` so it works the same for aws, google and tesseract) are bucketed in
+a uniform grid stored in CSR form, the words of a grid cell are
+`cell_words[cell_indptr[cell]:cell_indptr[cell + 1]]`. Region queries only look
+at the words of the cells the region covers and nearest queries search rings of
+cells around the point, so a query never scans every word of the page.
+
+>>> index = SpatialIndex(doc.result)
+>>> page = index.page(0)
+>>> page.text_within(0.5, 0.0, 1.0, 0.2)
+>>> label = page.find("Total amount")[0]
+>>> page.text_of(page.right_of(label))
+"""
+
+# Standart python libraries
+import math
+
+# 3rd party libraries
+import numpy as np
+
+# Own
+from .result import _decode
+
+
+class PageIndex:
+    """Grid index of the words of a page.
+
+    Parameters
+    ----------
+    texts : list
+        text of every word
+    boxes : numpy.ndarray
+        (n, 4) Left, Top, Width and Height of every word relative to the page,
+        words without a box (NaN) are never returned by the queries
+    confidences : numpy.ndarray, optional
+        confidence of every word
+    grid_size : int, optional
+        cells of the grid in each direction, by default about one cell per two
+        words
+
+    Attributes
+    ----------
+    lefts, tops, rights, bottoms : numpy.ndarray
+        edges of every word
+    cell_indptr, cell_words : numpy.ndarray
+        words of every cell of the grid in CSR form
+    """
+
+    __slots__ = (
+        "texts",
+        "boxes",
+        "confidences",
+        "grid_size",
+        "lefts",
+        "tops",
+        "rights",
+        "bottoms",
+        "cell_indptr",
+        "cell_words",
+    )
+
+    def __init__(self, texts, boxes, confidences=None, grid_size=None):
+        self.texts = list(texts)
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.confidences = confidences
+        self.grid_size = grid_size or min(256, max(1, int(math.sqrt(len(texts) / 2))))
+
+        self.lefts = self.boxes[:, 0]
+        self.tops = self.boxes[:, 1]
+        self.rights = self.boxes[:, 0] + self.boxes[:, 2]
+        self.bottoms = self.boxes[:, 1] + self.boxes[:, 3]
+        self._build_grid()
+
+    def _cell_range(self, start, end):
+        """Return the first and last grid cells covered by [start, end]."""
+        size = self.grid_size
+        first = np.clip(np.floor(start * size), 0, size - 1).astype(np.int64)
+        last = np.clip(np.floor(end * size), 0, size - 1).astype(np.int64)
+        return first, last
+
+    def _build_grid(self):
+        size = self.grid_size
+        words = np.flatnonzero(~np.isnan(self.boxes).any(axis=1))
+        x0, x1 = self._cell_range(self.lefts[words], self.rights[words])
+        y0, y1 = self._cell_range(self.tops[words], self.bottoms[words])
+
+        # Every word is added to every cell its box covers
+        widths = x1 - x0 + 1
+        counts = widths * (y1 - y0 + 1)
+        starts = np.cumsum(counts) - counts
+        local = np.arange(counts.sum()) - np.repeat(starts, counts)
+        cells = (np.repeat(y0, counts) + local // np.repeat(widths, counts)) * size + (
+            np.repeat(x0, counts) + local % np.repeat(widths, counts)
+        )
+        word_ids = np.repeat(words, counts)
+
+        order = np.argsort(cells, kind="stable")
+        self.cell_words = word_ids[order].astype(np.int32)
+        self.cell_indptr = np.zeros(size * size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=size * size), out=self.cell_indptr[1:])
+
+    def __len__(self):
+        return len(self.texts)
+
+    def _candidates(self, x0, y0, x1, y1):
+        """Words of the cells in the block of cells [x0, x1] x [y0, y1]."""
+        size = self.grid_size
+        rows = np.arange(y0, y1 + 1) * size
+        chunks = [
+            self.cell_words[self.cell_indptr[row + x0] : self.cell_indptr[row + x1 + 1]]
+            for row in rows
+        ]
+        return np.unique(np.concatenate([np.empty(0, dtype=np.int32)] + chunks))
+
+    def within(self, left, top, right, bottom, how="center"):
+        """Return the words inside a rectangle in reading order.
+
+        Parameters
+        ----------
+        left, top, right, bottom : float
+            edges of the rectangle relative to the page
+        how : str, optional
+            "center" (the center of the word is inside), "inside" (the whole word
+            is inside) or "overlap" (any part of the word is inside), by default
+            "center"
+
+        Returns
+        -------
+        numpy.ndarray
+            indices of the words
+        """
+        x0, x1 = self._cell_range(left, right)
+        y0, y1 = self._cell_range(top, bottom)
+        words = self._candidates(int(x0), int(y0), int(x1), int(y1))
+        lefts, tops = self.lefts[words], self.tops[words]
+        rights, bottoms = self.rights[words], self.bottoms[words]
+
+        if how == "center":
+            x, y = (lefts + rights) / 2, (tops + bottoms) / 2
+            mask = (x >= left) & (x <= right) & (y >= top) & (y <= bottom)
+        elif how == "inside":
+            mask = (
+                (lefts >= left)
+                & (rights <= right)
+                & (tops >= top)
+                & (bottoms <= bottom)
+            )
+        elif how == "overlap":
+            mask = (
+                (lefts <= right)
+                & (rights >= left)
+                & (tops <= bottom)
+                & (bottoms >= top)
+            )
+        else:
+            raise Exception(f"Unknown mode {how}, use center, inside or overlap")
+        return self.reading_order(words[mask])
+
+    def text_of(self, words):
+        """Return the text of some words joined by spaces."""
+        return " ".join(self.texts[k] for k in words)
+
+    def text_within(self, left, top, right, bottom, how="center"):
+        """Return the text inside a rectangle in reading order."""
+        return self.text_of(self.within(left, top, right, bottom, how))
+
+    def nearest(self, x, y, k=1, max_distance=None):
+        """Return the words closest to a point (distance to their box).
+
+        Rings of grid cells around the point are searched until the kth closest
+        word found can't be beaten by the words of the next ring.
+
+        Parameters
+        ----------
+        x, y : float
+            point relative to the page
+        k : int, optional
+            number of words, by default 1
+        max_distance : float, optional
+            words farther than this aren't returned, by default no limit
+
+        Returns
+        -------
+        numpy.ndarray
+            indices of the words, closest first
+        """
+        size = self.grid_size
+        cx, cy = (int(min(max(v * size, 0), size - 1)) for v in (x, y))
+        found = np.empty(0, dtype=np.int32)
+        for ring in range(size):
+            x0, x1 = max(cx - ring, 0), min(cx + ring, size - 1)
+            y0, y1 = max(cy - ring, 0), min(cy + ring, size - 1)
+            found = self._candidates(x0, y0, x1, y1)
+            distances = self._distances(found, x, y)
+            # Words outside the block are at least this far from the point
+            reach = ring / size
+            if max_distance is not None and reach > max_distance:
+                break
+            if (distances <= reach).sum() >= k:
+                break
+
+        distances = self._distances(found, x, y)
+        order = np.argsort(distances, kind="stable")
+        if max_distance is not None:
+            order = order[distances[order] <= max_distance]
+        return found[order[:k]]
+
+    def _distances(self, words, x, y):
+        dx = np.maximum(np.maximum(self.lefts[words] - x, 0), x - self.rights[words])
+        dy = np.maximum(np.maximum(self.tops[words] - y, 0), y - self.bottoms[words])
+        return np.hypot(dx, dy)
+
+    def find(self, phrase):
+        """Find a phrase (one or more words) in the page, ignoring case.
+
+        Returns
+        -------
+        list
+            indices of the words of every occurrence
+        """
+        targets = phrase.casefold().split()
+        if not targets:
+            return []
+        order = self.reading_order()
+        words = [self.texts[k].casefold() for k in order]
+        matches = []
+        for start in range(len(words) - len(targets) + 1):
+            if words[start : start + len(targets)] == targets:
+                matches.append(order[start : start + len(targets)])
+        return matches
+
+    def _bounds(self, words):
+        words = np.asarray(words)
+        return (
+            self.lefts[words].min(),
+            self.tops[words].min(),
+            self.rights[words].max(),
+            self.bottoms[words].max(),
+        )
+
+    def right_of(self, words, max_distance=1.0):
+        """Return the words in the same line and to the right of some words (a
+        label), closest first."""
+        left, top, right, bottom = self._bounds(words)
+        middle = (top + bottom) / 2
+        candidates = self.within(right, top, right + max_distance, bottom, "overlap")
+        centers = (self.tops[candidates] + self.bottoms[candidates]) / 2
+        tolerance = (bottom - top) / 2
+        candidates = candidates[
+            (np.abs(centers - middle) <= tolerance) & (self.lefts[candidates] >= right)
+        ]
+        return candidates[np.argsort(self.lefts[candidates], kind="stable")]
+
+    def below(self, words, max_distance=0.1):
+        """Return the words under some words (a label) that overlap them
+        horizontally, in reading order."""
+        left, top, right, bottom = self._bounds(words)
+        candidates = self.within(left, bottom, right, bottom + max_distance, "overlap")
+        return candidates[self.tops[candidates] >= bottom]
+
+    def reading_order(self, words=None):
+        """Sort words in lines from top to bottom and left to right.
+
+        A word starts a new line when its vertical center is more than half of
+        the median word height below the center of the line.
+
+        Parameters
+        ----------
+        words : array_like, optional
+            indices of the words to sort, by default every word with a box
+
+        Returns
+        -------
+        numpy.ndarray
+            indices of the words sorted
+        """
+        if words is None:
+            words = np.flatnonzero(~np.isnan(self.boxes).any(axis=1))
+        words = np.asarray(words, dtype=np.int64)
+        if not len(words):
+            return words
+
+        centers = (self.tops[words] + self.bottoms[words]) / 2
+        tolerance = np.median(self.bottoms[words] - self.tops[words]) / 2
+        by_center = np.argsort(centers, kind="stable")
+        gaps = np.diff(centers[by_center]) > tolerance
+        lines = np.empty(len(words), dtype=np.int64)
+        lines[by_center] = np.concatenate([[0], np.cumsum(gaps)])
+        return words[np.lexsort((self.lefts[words], lines))]
+
+
+class SpatialIndex:
+    """Spatial indices of the pages of a document, built on first use.
+
+    Parameters
+    ----------
+    result : OcrResult
+        results of the document
+    grid_size : int, optional
+        cells of the grid of every page in each direction, by default chosen
+        from the number of words of the page
+    """
+
+    def __init__(self, result, grid_size=None):
+        self.result = result
+        self.grid_size = grid_size
+        self._pages = {}
+
+        # Words are sorted by page in the result
+        pages = np.arange(result.num_pages + 1)
+        self._bounds = np.searchsorted(result.word_pages, pages)
+
+    def __len__(self):
+        return self.result.num_pages
+
+    def page(self, page):
+        """Return the `PageIndex` of a page (starting at 0)."""
+        if page not in self._pages:
+            start, end = self._bounds[page], self._bounds[page + 1]
+            result = self.result
+            texts = [
+                _decode(result.word_offsets, result.word_data, k)
+                for k in range(start, end)
+            ]
+            self._pages[page] = PageIndex(
+                texts,
+                result.word_boxes[start:end],
+                result.word_confidences[start:end],
+                self.grid_size,
+            )
+        return self._pages[page]
@@ -0,0 +1,220 @@
+"""Tables stored as flat arrays of cells and their export to pandas and files.
+
+A `Table` keeps the row, column and text of every cell in flat arrays plus the
+merged regions (row and column spans). It's still read as {row: {column: text}}
+like the tables built from dicts, so existing code keeps working, but it's
+turned into a DataFrame in one vectorized step and many tables are exported at
+once in long format (one row per cell).
+
+>>> table = pages_tables[0][0]
+>>> table[1][2]
+>>> table.to_pandas()
+>>> tables_to_parquet(pages_tables, "tables.parquet")
+"""
+
+# Standart python libraries
+from collections.abc import Mapping
+
+# 3rd party libraries
+import numpy as np
+
+# pandas is imported where it's used, it's slow to import and not needed to
+# read or store tables
+
+
+class Table(Mapping):
+    """Table with its cells in flat arrays, read as {row: {column: text}}.
+
+    Parameters
+    ----------
+    rows, columns : array_like
+        row and column (starting at 1) of every cell
+    texts : list
+        text of every cell
+    merged : array_like, optional
+        (n, 4) array with the row, column, row span and column span of every
+        merged region, by default no merged regions
+    """
+
+    __slots__ = ("rows", "columns", "texts", "merged")
+
+    def __init__(self, rows, columns, texts, merged=None):
+        self.rows = np.asarray(rows, dtype=np.int32)
+        self.columns = np.asarray(columns, dtype=np.int32)
+        self.texts = list(texts)
+        self.merged = np.asarray(
+            merged if merged is not None else (), dtype=np.int32
+        ).reshape(-1, 4)
+
+    @classmethod
+    def from_dict(cls, table):
+        """Build a table from {row: {column: text}}."""
+        cells = [
+            (row, column, text)
+            for row, row_cells in table.items()
+            for column, text in row_cells.items()
+        ]
+        rows, columns, texts = zip(*cells) if cells else ((), (), ())
+        return cls(rows, columns, texts)
+
+    @classmethod
+    def from_grid(cls, grid):
+        """Build a table from a list of rows (lists with the text of each column)."""
+        num_rows = len(grid)
+        num_columns = len(grid[0]) if num_rows else 0
+        rows = np.repeat(np.arange(1, num_rows + 1), num_columns)
+        columns = np.tile(np.arange(1, num_columns + 1), num_rows)
+        return cls(rows, columns, [text for row in grid for text in row])
+
+    def __getitem__(self, row):
+        cells = np.flatnonzero(self.rows == row)
+        if not len(cells):
+            raise KeyError(row)
+        return {int(self.columns[k]): self.texts[k] for k in cells}
+
+    def __iter__(self):
+        return iter(dict.fromkeys(self.rows.tolist()))
+
+    def __len__(self):
+        return len(np.unique(self.rows))
+
+    def __repr__(self):
+        return f"Table({self.shape[0]} rows, {self.shape[1]} columns)"
+
+    @property
+    def shape(self):
+        """Number of rows and columns, counting the spans of merged regions."""
+        if not len(self.rows):
+            return 0, 0
+        num_rows, num_columns = int(self.rows.max()), int(self.columns.max())
+        if len(self.merged):
+            num_rows = max(
+                num_rows, int((self.merged[:, 0] + self.merged[:, 2]).max()) - 1
+            )
+            num_columns = max(
+                num_columns, int((self.merged[:, 1] + self.merged[:, 3]).max()) - 1
+            )
+        return num_rows, num_columns
+
+    def to_grid(self, fill_merged=True):
+        """Return the table as a 2d object array, missing cells are NaN.
+
+        Parameters
+        ----------
+        fill_merged : bool, optional
+            if True every cell of a merged region gets the text of the whole
+            region, by default True
+        """
+        grid = np.full(self.shape, np.nan, dtype=object)
+        texts = np.empty(len(self.texts), dtype=object)
+        texts[:] = self.texts
+        grid[self.rows - 1, self.columns - 1] = texts
+
+        if fill_merged:
+            for row, column, row_span, column_span in self.merged:
+                region = grid[
+                    row - 1 : row - 1 + row_span, column - 1 : column - 1 + column_span
+                ]
+                words = [
+                    text.strip()
+                    for text in region.ravel()
+                    if isinstance(text, str) and text.strip()
+                ]
+                region[...] = " ".join(words)
+        return grid
+
+    def to_pandas(self, fill_merged=True):
+        """Return the table as a DataFrame indexed by row and column (from 1).
+
+        Parameters
+        ----------
+        fill_merged : bool, optional
+            if True every cell of a merged region gets the text of the whole
+            region, by default True
+        """
+        import pandas as pd
+
+        grid = self.to_grid(fill_merged)
+        return pd.DataFrame(
+            grid,
+            index=pd.RangeIndex(1, grid.shape[0] + 1),
+            columns=pd.RangeIndex(1, grid.shape[1] + 1),
+        )
+
+
+def as_table(table):
+    """Return `table` as a `Table`, tables built from dicts are converted."""
+    return table if isinstance(table, Table) else Table.from_dict(table)
+
+
+def iter_tables(pages_tables):
+    """Yield the page (starting at 1) and the `Table` of every table."""
+    for page, tables in enumerate(pages_tables or []):
+        for table in tables or []:
+            yield page + 1, as_table(table)
+
+
+def tables_to_frame(pages_tables):
+    """Return every cell of every table in a single long DataFrame.
+
+    Parameters
+    ----------
+    pages_tables : list
+        tables of the page i at the ith position
+
+    Returns
+    -------
+    pandas.DataFrame
+        `table`, `page`, `row`, `column` and `text` of every cell
+    """
+    import pandas as pd
+
+    tables = list(iter_tables(pages_tables))
+    sizes = [len(table.rows) for _, table in tables]
+    empty = np.empty(0, dtype=np.int32)
+    return pd.DataFrame(
+        {
+            "table": np.repeat(np.arange(len(tables), dtype=np.int32), sizes),
+            "page": np.repeat(
+                np.array([page for page, _ in tables], dtype=np.int32), sizes
+            ),
+            "row": np.concatenate([empty] + [table.rows for _, table in tables]),
+            "column": np.concatenate([empty] + [table.columns for _, table in tables]),
+            "text": [text for _, table in tables for text in table.texts],
+        }
+    )
+
+
+def tables_to_xlsx(pages_tables, file_path, engine=None, fill_merged=True):
+    """Write every table in its own sheet of an Excel file.
+
+    Parameters
+    ----------
+    pages_tables : list
+        tables of the page i at the ith position
+    file_path : str
+        path of the xlsx file
+    engine : str, optional
+        pandas Excel writer ("xlsxwriter", "openpyxl"), by default the one of
+        pandas
+    fill_merged : bool, optional
+        if True every cell of a merged region gets the text of the whole region,
+        by default True
+    """
+    import pandas as pd
+
+    with pd.ExcelWriter(file_path, engine=engine) as writer:
+        for k, (page, table) in enumerate(iter_tables(pages_tables)):
+            table.to_pandas(fill_merged).to_excel(
+                writer, sheet_name=f"Page_{page}_Table_{k}"
+            )
+
+
+def tables_to_parquet(pages_tables, file_path):
+    """Write the cells of every table to a parquet file (see `tables_to_frame`)."""
+    tables_to_frame(pages_tables).to_parquet(file_path, index=False)
+
+
+def tables_to_csv(pages_tables, file_path):
+    """Write the cells of every table to a csv file (see `tables_to_frame`)."""
+    tables_to_frame(pages_tables).to_csv(file_path, index=False)
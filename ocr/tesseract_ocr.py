@@ -0,0 +1,213 @@
+"""Module to do OCR with tesseract directly, without tika and the JVM.
+
+Pages are rendered in memory and sent to a pool of processes, every process
+keeps a warm tesseract instance (through `tesserocr`) that is reused for all
+the pages it receives. Besides the text of each page the words are returned as
+textract-like WORD blocks with their confidence and normalized bounding box.
+
+>>> doc = TesseractOcr(file_path, workers=4)
+>>> doc.pipeline_extraction()
+>>> doc.pages_response[0][0]["Geometry"]["BoundingBox"]
+"""
+
+# Standart python libraries
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# 3rd party libraries
+from PIL import Image
+from tesserocr import PyTessBaseAPI, RIL, iterate_level
+
+# Own
+from .async_utils import run_blocking, run_sync
+from .ocr_document import Document
+
+admitted_extensions = ["pdf", "jpg", "jpeg", "png", "tiff", "tif"]
+
+# Language -> (workers, executor)
+_executors = {}
+_executors_lock = threading.Lock()
+_api = None
+
+
+def _start_worker(lang):
+    global _api
+    _api = PyTessBaseAPI(lang=lang)
+
+
+def _ocr_page(page, mode, size, data):
+    """OCR one page in a worker process with its tesseract instance.
+
+    Parameters
+    ----------
+    page : int
+        page number
+    mode, size, data
+        PIL mode, size and raw bytes of the image
+
+    Returns
+    -------
+    str
+        text of the page
+    list
+        WORD blocks of the page
+    """
+    image = Image.frombytes(mode, size, data)
+    width, height = size
+    _api.SetImage(image)
+    _api.Recognize()
+    text = _api.GetUTF8Text()
+
+    words = []
+    level = RIL.WORD
+    for k, word in enumerate(iterate_level(_api.GetIterator(), level)):
+        box = word.BoundingBox(level)
+        if box is None:
+            continue
+        left, top, right, bottom = box
+        words.append(
+            {
+                "BlockType": "WORD",
+                "Id": f"{page}-{k}",
+                "Page": page,
+                "Text": word.GetUTF8Text(level),
+                "Confidence": word.Confidence(level),
+                "Geometry": {
+                    "BoundingBox": {
+                        "Left": left / width,
+                        "Top": top / height,
+                        "Width": (right - left) / width,
+                        "Height": (bottom - top) / height,
+                    }
+                },
+            }
+        )
+    return text, words
+
+
+def _get_executor(workers, lang):
+    # Called with the lock held
+    pool = _executors.get(lang)
+    if pool is None or pool[0] != workers:
+        if pool is not None:
+            # The pages already submitted are finished before the processes exit
+            pool[1].shutdown(wait=False)
+        executor = ProcessPoolExecutor(
+            max_workers=workers, initializer=_start_worker, initargs=(lang,)
+        )
+        pool = _executors[lang] = (workers, executor)
+    return pool[1]
+
+
+def submit(workers, lang, function, *args):
+    """Submit a call to the process-wide pool of tesseract processes of `lang`.
+
+    There's one pool per language, it's replaced when a document asks for a
+    different number of `workers` and the old one is shut down.
+
+    Returns
+    -------
+    concurrent.futures.Future
+        future with the result of the call
+    """
+    with _executors_lock:
+        return _get_executor(workers, lang).submit(function, *args)
+
+
+class TesseractOcr(Document):
+    """Class to do OCR of pdfs and images with a pool of tesseract processes.
+
+    Parameters
+    ----------
+    Document : Object
+        super class with the basic atributes to handle a document
+
+    Attributes
+    ----------
+    file_path : str
+        local path to the file that will be processed
+    lang : str
+        tesseract language(s), "eng" or "spa+eng" for example
+    workers : int
+        number of tesseract processes (one warm instance per process)
+    rasterization : dict
+        options of `Document.iter_rasterized_pages` used for pdfs
+    pages_text : list
+        list with the text of the page i at the ith position
+    text : str
+        full text of the document
+    pages_response : list
+        list with the WORD blocks (textract-like dicts) of the page i at the ith
+        position
+    num_pages: int
+        number of pages of the document
+
+    Raises
+    ------
+    TypeError
+        If your file extension isn't supporter. Supported files are pdf and images.
+    """
+
+    def __init__(self, file_path, lang="eng", workers=None, **rasterization):
+        super().__init__(file_path)
+        self._validate_extension()
+
+        self.lang = lang
+        self.workers = workers or os.cpu_count() or 1
+        self.rasterization = dict({"dpi": 300}, **rasterization)
+
+    def _validate_extension(self):
+        if self.extension not in admitted_extensions:
+            raise TypeError("File extension {} isn't supported".format(self.extension))
+
+    def pipeline_extraction(self):
+        """Main function to perform the extraction
+        """
+        run_sync(self.apipeline_extraction())
+
+    async def apipeline_extraction(self):
+        """Asynchronous version of `pipeline_extraction`.
+
+        Pages are rendered while the previous ones are in tesseract, at most two
+        pages per worker wait in memory.
+        """
+        in_flight = asyncio.Semaphore(2 * self.workers)
+
+        async def recognize(page, image):
+            try:
+                payload = (image.mode, image.size, image.tobytes())
+                image.close()
+                return await asyncio.wrap_future(
+                    submit(self.workers, self.lang, _ocr_page, page, *payload)
+                )
+            finally:
+                in_flight.release()
+
+        images = self._iter_images()
+        tasks = []
+        try:
+            while True:
+                await in_flight.acquire()
+                image = await run_blocking(next, images, None)
+                if image is None:
+                    in_flight.release()
+                    break
+                tasks.append(asyncio.ensure_future(recognize(len(tasks) + 1, image)))
+            results = await asyncio.gather(*tasks)
+        finally:
+            images.close()
+
+        self.pages_text = [text for text, _ in results]
+        self.pages_response = [words for _, words in results]
+        self.text = "\n".join(self.pages_text)
+        self.num_pages = len(self.pages_text)
+
+    def _iter_images(self):
+        if self.extension == "pdf":
+            yield from self.iter_rasterized_pages(**self.rasterization)
+        else:
+            with Image.open(self.file_path) as image:
+                image.load()
+                yield image if image.mode in ("L", "RGB") else image.convert("RGB")
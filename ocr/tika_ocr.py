@@ -1,61 +1,178 @@
 from tika import parser
+import asyncio
+import io
 import os
 import shutil
-from multiprocessing import Pool
 import regex as re
+from .async_utils import run_blocking, run_sync
 from .ocr_document import Document
+from .tika_server_pool import get_server_pool
+
+
+def clean_content(content):
+    """Return the text of a tika response with tabs and blank lines removed."""
+    if "content" in content:
+        text = content["content"]
+    else:
+        return ""
+    # Convert to string
+    text = re.sub(r"\t", " ", str(text))
+    return re.sub(r"\n\s*\n", "\n", str(text))
+
+
+def extract_text_layer(document, pages):
+    """Return the text layer of some pages of a pdf read by tika, without OCR.
+
+    Tika decodes fonts that PyPDF2 can't (Type0 fonts with a ToUnicode map), it's
+    used for the pages whose PyPDF2 text is glyph codes.
+
+    Parameters
+    ----------
+    document : Document
+        pdf document
+    pages : list
+        indices (starting at 0) of the pages
+
+    Returns
+    -------
+    list
+        text of the page pages[i] at the ith position
+    """
+    wanted = set(pages)
+    texts = {}
+    for page, buffer in enumerate(document.iter_pages()):
+        if page in wanted:
+            texts[page] = clean_content(parser.from_buffer(buffer))
+    return [texts[page] for page in pages]
 
 
 class TikaOcr(Document):
     """Class to permorm text extraction that uses apache tika interface for textract.
 
+    Pdf pages are split in memory and sent to tika one by one, `use_temp_files`
+    writes them to a temporary folder instead. To do OCR the pages are rendered
+    a few at a time and every image is sent to tika as soon as it's ready, the
+    `rasterization` options (dpi, fmt, grayscale, thread_count, chunk_size) are
+    passed to `Document.iter_rasterized_pages`.
+
+    With `workers` > 1 the pages are OCR'd in parallel by a pool of local tika
+    servers (one per worker) while the next pages are rendered, the text is
+    reassembled in page order.
+
     Parameters
     ----------
     Document : [type]
         [description]
     """    
-    def __init__(self, file_path, ocr=False):
+    def __init__(
+        self, file_path, ocr=False, use_temp_files=False, workers=1, **rasterization
+    ):
         super().__init__(file_path)
         self.ocr = ocr
-        if ocr is True and self.extension == "pdf":
-            self.img_folder = self.folder + self.filename.split(".")[0]
-            if not os.path.exists(self.img_folder):
-                os.mkdir(self.img_folder)
-            self.num_pages = self._pdf_to_jpg()
+        self.use_temp_files = use_temp_files
+        self.workers = workers
+        self.rasterization = dict({"dpi": 500}, **rasterization)
 
     def pipeline_extraction(self):
-        if self.ocr is True and self.extension == "pdf":
-            self._process_ocr()
+        run_sync(self.apipeline_extraction())
+
+    async def apipeline_extraction(self):
+        """Asynchronous version of `pipeline_extraction`.
+
+        The calls to tika run in the default executor, so the event loop can drive
+        other documents while tika is working.
+        """
+        if self.ocr is True and self.extension == "pdf" and self.workers > 1:
+            await self._process_ocr_parallel()
+        elif self.ocr is True and self.extension == "pdf":
+            await self._process_ocr()
+        elif self.extension != "pdf":
+            self.pages_text = [await run_blocking(self._tika_parse, self.file_path)]
+            self.text = self.pages_text[0]
         else:
-            self.num_pages, folder = self.split_pdf_in_pages()
-            self.pages_text = []
-            for filename in sorted(os.listdir(folder)):
-                self.pages_text.append(self._tika_parse(folder + filename))
+            if self.use_temp_files:
+                await self._process_pages_files()
+            else:
+                await self._process_pages()
+            self.num_pages = len(self.pages_text)
             self.text = '\n \n'.join(self.pages_text)
+
+    async def _process_pages(self):
+        pages = self.iter_pages()
+        self.pages_text = []
+        try:
+            while True:
+                page = await run_blocking(next, pages, None)
+                if page is None:
+                    break
+                text = await run_blocking(self._tika_parse_buffer, page)
+                self.pages_text.append(text)
+        finally:
+            pages.close()
+
+    async def _process_pages_files(self):
+        _, folder = await run_blocking(self.split_pdf_in_pages)
+        self.pages_text = []
+        try:
+            for filename in sorted(os.listdir(folder)):
+                text = await run_blocking(self._tika_parse, folder + filename)
+                self.pages_text.append(text)
+        finally:
             shutil.rmtree(folder)
 
-    def _process_ocr_parallel(self):
-        paths = [
-            (self.img_folder + "/" + str(k) + ".jpg",) for k in range(self.num_pages)
-        ]
-        with Pool() as p:
-            self.pages_text = p.starmap(self._tika_parse, paths)
-        self.text = "\n".join(self.pages_text)
+    async def _process_ocr_parallel(self):
+        pool = await run_blocking(get_server_pool, self.workers)
+        # Bounds the rendered pages waiting for a server
+        in_flight = asyncio.Semaphore(2 * self.workers)
+
+        async def parse(image):
+            try:
+                return await run_blocking(self._tika_parse_image, image, pool)
+            finally:
+                in_flight.release()
 
-    def _process_ocr(self):
+        images = self.iter_rasterized_pages(**self.rasterization)
+        tasks = []
+        try:
+            while True:
+                await in_flight.acquire()
+                image = await run_blocking(next, images, None)
+                if image is None:
+                    in_flight.release()
+                    break
+                tasks.append(asyncio.ensure_future(parse(image)))
+            self.pages_text = list(await asyncio.gather(*tasks))
+        finally:
+            images.close()
+        self.text = "\n".join(self.pages_text)
 
-        paths = [self.img_folder + "/" + str(k) + ".jpg" for k in range(self.num_pages)]
-        self.text_per_page = []
-        for path in paths:
-            self.pages_text.append(self._tika_parse(path))
-        self.text = "\n".join(self.text_per_page)
+    async def _process_ocr(self):
+        images = self.iter_rasterized_pages(**self.rasterization)
+        self.pages_text = []
+        try:
+            while True:
+                image = await run_blocking(next, images, None)
+                if image is None:
+                    break
+                text = await run_blocking(self._tika_parse_image, image)
+                self.pages_text.append(text)
+        finally:
+            images.close()
+        self.text = "\n".join(self.pages_text)
 
     def _tika_parse(self, file_path):
-        content = parser.from_file(file_path)
-        if "content" in content:
-            text = content["content"]
-        else:
-            return ""
-        # Convert to string
-        text = re.sub(r"\t", " ", str(text))
-        return re.sub(r"\n\s*\n", "\n", str(text))
+        return self._clean_content(parser.from_file(file_path))
+
+    def _tika_parse_buffer(self, buffer, pool=None):
+        if pool is not None:
+            return self._clean_content(pool.parse_buffer(buffer))
+        return self._clean_content(parser.from_buffer(buffer))
+
+    def _tika_parse_image(self, image, pool=None):
+        buffer = io.BytesIO()
+        image.save(buffer, format=image.format or "PNG")
+        image.close()
+        return self._tika_parse_buffer(buffer.getvalue(), pool)
+
+    def _clean_content(self, content):
+        return clean_content(content)
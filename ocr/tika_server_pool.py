@@ -0,0 +1,199 @@
+"""Pool of long lived local tika servers.
+
+The python client of tika sends every file over HTTP to a single tika server, a
+JVM that runs tesseract. To OCR pages in parallel the pool starts one server per
+worker in consecutive ports and lends each request a free server, so the servers
+are started once per process and never share work. There's one pool per first
+port, it grows when more workers are asked for, and the default ports are away
+from 9998 (the server the tika client starts on its own).
+
+>>> pool = get_server_pool(4)
+>>> text = pool.parse_buffer(image_bytes)["content"]
+"""
+
+# Standart python libraries
+import atexit
+import os
+import queue
+import subprocess
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+
+# 3rd party libraries
+from tika import parser
+from tika import tika
+
+default_first_port = 9100
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_server_pool(size, first_port=default_first_port):
+    """Return the process-wide pool of servers from `first_port` with at least
+    `size` servers, starting it or adding servers if needed.
+
+    Parameters
+    ----------
+    size : int
+        minimum number of tika servers
+    first_port : int, optional
+        port of the first server, the rest use the following ports, by default
+        9100
+
+    Returns
+    -------
+    TikaServerPool
+        started pool
+    """
+    with _pools_lock:
+        if first_port not in _pools:
+            pool = TikaServerPool(size, first_port)
+            pool.start()
+            atexit.register(pool.close)
+            _pools[first_port] = pool
+        else:
+            _pools[first_port].grow(size)
+        return _pools[first_port]
+
+
+class TikaServerPool:
+    """Start and lend a group of tika servers running in local processes.
+
+    Parameters
+    ----------
+    size : int, optional
+        number of servers, by default the number of cores
+    first_port : int, optional
+        port of the first server, by default 9100
+    host : str, optional
+        host the servers listen to, by default "localhost"
+    jar_path : str, optional
+        path of the tika server jar, by default the jar downloaded by the tika
+        client (it's downloaded if it doesn't exist)
+    startup_timeout : float, optional
+        seconds to wait for every server to answer, by default 120
+
+    Attributes
+    ----------
+    endpoints : list
+        url of every server
+    """
+
+    def __init__(
+        self,
+        size=None,
+        first_port=default_first_port,
+        host="localhost",
+        jar_path=None,
+        startup_timeout=120,
+    ):
+        self.size = size or os.cpu_count() or 1
+        self.host = host
+        self.jar_path = jar_path or os.environ.get(
+            "TIKA_SERVER_JAR", os.path.join(tika.TikaJarPath, "tika-server.jar")
+        )
+        self.startup_timeout = startup_timeout
+
+        self.first_port = first_port
+        self.ports = [first_port + k for k in range(self.size)]
+        self.endpoints = [f"http://{host}:{port}" for port in self.ports]
+        self.processes = []
+        self._free = queue.Queue()
+
+    def start(self):
+        """Start the servers that aren't already running and wait for them."""
+        self._start_servers(self.ports, self.endpoints)
+
+    def grow(self, size):
+        """Start servers in the following ports until the pool has `size`."""
+        if size <= self.size:
+            return
+        ports = [self.first_port + k for k in range(self.size, size)]
+        endpoints = [f"http://{self.host}:{port}" for port in ports]
+        self._start_servers(ports, endpoints)
+        self.ports += ports
+        self.endpoints += endpoints
+        self.size = size
+
+    def _start_servers(self, ports, endpoints):
+        if not os.path.exists(self.jar_path):
+            tika.getRemoteJar(tika.TikaServerJar, self.jar_path)
+
+        for port, endpoint in zip(ports, endpoints):
+            if not self._is_running(endpoint):
+                self.processes.append(
+                    subprocess.Popen(
+                        [
+                            "java",
+                            "-jar",
+                            self.jar_path,
+                            "--host",
+                            self.host,
+                            "--port",
+                            str(port),
+                        ],
+                        stdout=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL,
+                    )
+                )
+
+        deadline = time.time() + self.startup_timeout
+        for endpoint in endpoints:
+            while not self._is_running(endpoint):
+                if time.time() > deadline:
+                    self.close()
+                    raise Exception(f"Tika server {endpoint} didn't start")
+                time.sleep(0.5)
+            self._free.put(endpoint)
+
+    def _is_running(self, endpoint):
+        try:
+            with urllib.request.urlopen(endpoint + "/tika", timeout=2) as response:
+                return response.status == 200
+        except OSError:
+            return False
+
+    @contextmanager
+    def endpoint(self):
+        """Borrow a free server, the caller waits until one is available.
+
+        Yields
+        ------
+        str
+            url of the server
+        """
+        endpoint = self._free.get()
+        try:
+            yield endpoint
+        finally:
+            self._free.put(endpoint)
+
+    def parse_buffer(self, buffer):
+        """Parse a file in memory with one of the servers of the pool.
+
+        Parameters
+        ----------
+        buffer : bytes
+            content of the file
+
+        Returns
+        -------
+        dict
+            tika response (`content` and `metadata`)
+        """
+        with self.endpoint() as endpoint:
+            return parser.from_buffer(buffer, serverEndpoint=endpoint)
+
+    def close(self):
+        """Stop the servers started by the pool."""
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.processes = []
@@ -0,0 +1,124 @@
+import json
+import threading
+import time
+
+import pytest
+
+from ocr import aws_job_dispatcher
+from ocr.aws_job_dispatcher import TextractJobDispatcher
+
+
+class FakeSqs:
+    """In-memory SQS queue with visibility timeouts and long polling."""
+
+    def __init__(self, fail_receives=0):
+        self.messages = {}
+        self.visible_at = {}
+        self.receives = 0
+        self.deleted = []
+        self.fail_receives = fail_receives
+        self.lock = threading.Lock()
+
+    def send(self, body, sent=None):
+        with self.lock:
+            handle = str(len(self.messages))
+            sent = time.time() if sent is None else sent
+            self.messages[handle] = {
+                "ReceiptHandle": handle,
+                "Body": body,
+                "Attributes": {"SentTimestamp": str(int(sent * 1000))},
+            }
+            self.visible_at[handle] = 0
+        return handle
+
+    def notify(self, job_id, status="SUCCEEDED", sent=None):
+        message = json.dumps({"JobId": job_id, "Status": status})
+        return self.send(json.dumps({"Message": message}), sent)
+
+    def receive_message(self, QueueUrl, WaitTimeSeconds, **kwargs):
+        with self.lock:
+            self.receives += 1
+            if self.fail_receives:
+                self.fail_receives -= 1
+                raise ConnectionError("throttled")
+        deadline = time.time() + WaitTimeSeconds
+        while True:
+            with self.lock:
+                now = time.time()
+                visible = [
+                    handle
+                    for handle, at in self.visible_at.items()
+                    if handle in self.messages and at <= now
+                ]
+                if visible:
+                    for handle in visible:
+                        self.visible_at[handle] = now + 30
+                    return {"Messages": [self.messages[h] for h in visible[:10]]}
+            if time.time() >= deadline:
+                return {}
+            time.sleep(0.01)
+
+    def change_message_visibility(self, QueueUrl, ReceiptHandle, VisibilityTimeout):
+        with self.lock:
+            self.visible_at[ReceiptHandle] = time.time() + VisibilityTimeout
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        with self.lock:
+            self.messages.pop(ReceiptHandle, None)
+            self.deleted.append(ReceiptHandle)
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(aws_job_dispatcher, "max_backoff", 0.2)
+
+
+def test_notification_finishes_its_job():
+    sqs = FakeSqs()
+    dispatcher = TextractJobDispatcher(sqs, "queue", wait_time=0.2)
+    dispatcher.register("job")
+    handle = sqs.notify("job", "FAILED")
+
+    assert dispatcher.wait("job", timeout=5) == "FAILED"
+    assert handle in sqs.deleted
+
+
+def test_foreign_message_doesnt_spin():
+    sqs = FakeSqs()
+    dispatcher = TextractJobDispatcher(sqs, "queue", wait_time=0.2)
+    handle = sqs.notify("other-process")
+
+    with pytest.raises(TimeoutError):
+        dispatcher.wait("job", timeout=1)
+
+    assert sqs.receives < 20
+    assert handle in sqs.messages
+
+
+def test_bad_messages_dont_fail_other_jobs():
+    sqs = FakeSqs(fail_receives=3)
+    dispatcher = TextractJobDispatcher(sqs, "queue", wait_time=0.2)
+    dispatcher.register("job")
+    confirmation = sqs.send(
+        json.dumps({"Type": "SubscriptionConfirmation", "Message": "You have chosen"})
+    )
+    garbage = sqs.send("not json")
+    sqs.notify("job")
+
+    assert dispatcher.wait("job", timeout=5) == "SUCCEEDED"
+    assert confirmation in sqs.deleted and garbage in sqs.deleted
+
+
+def test_orphaned_notifications_are_deleted():
+    sqs = FakeSqs()
+    dispatcher = TextractJobDispatcher(sqs, "queue", wait_time=0.2)
+    with pytest.raises(TimeoutError):
+        dispatcher.wait("gone", timeout=0.1)
+
+    abandoned = sqs.notify("gone")
+    old = sqs.notify("crashed", sent=time.time() - 2 * aws_job_dispatcher.orphan_age)
+    dispatcher.register("job")
+    sqs.notify("job")
+
+    assert dispatcher.wait("job", timeout=5) == "SUCCEEDED"
+    assert abandoned in sqs.deleted and old in sqs.deleted
@@ -0,0 +1,182 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from ocr.aws_block_store import BlockList, BlockStore
+from ocr.aws_response_formatter import ResponseFormatter
+
+
+def word(block_id, text, page):
+    return {"BlockType": "WORD", "Id": block_id, "Text": text, "Page": page}
+
+
+def block(block_type, block_id, page, children=(), values=(), **attributes):
+    relationships = []
+    if children:
+        relationships.append({"Type": "CHILD", "Ids": list(children)})
+    if values:
+        relationships.append({"Type": "VALUE", "Ids": list(values)})
+    attributes.update(BlockType=block_type, Id=block_id, Page=page)
+    if relationships:
+        attributes["Relationships"] = relationships
+    return attributes
+
+
+def cell(block_id, row, column, children, page=1, row_span=1, column_span=1):
+    return block(
+        "CELL",
+        block_id,
+        page,
+        children,
+        RowIndex=row,
+        ColumnIndex=column,
+        RowSpan=row_span,
+        ColumnSpan=column_span,
+    )
+
+
+def key(block_id, children, value_id, page):
+    return block(
+        "KEY_VALUE_SET", block_id, page, children, [value_id], EntityTypes=["KEY"]
+    )
+
+
+def value(block_id, children, page):
+    return block("KEY_VALUE_SET", block_id, page, children, EntityTypes=["VALUE"])
+
+
+# Two pages: a line, a form and a table with a merged header and a selection
+# mark, then a page with a selection in a value and a repeated key
+BLOCKS = [
+    block("PAGE", "p1", 1),
+    block("LINE", "l1", 1, ["w1", "w2"], Text="Name: John"),
+    word("w1", "Name:", 1),
+    word("w2", "John", 1),
+    key("k1", ["w1"], "v1", 1),
+    value("v1", ["w2"], 1),
+    word("w3", "Item", 1),
+    word("w4", "Paid", 1),
+    word("w5", "Pen", 1),
+    block("SELECTION_ELEMENT", "s1", 1, SelectionStatus="SELECTED", Confidence=99.0),
+    block("TABLE", "t1", 1, ["c11", "c12", "c21", "c22"]),
+    cell("c11", 1, 1, ["w3"]),
+    cell("c12", 1, 2, ["w4"]),
+    cell("c21", 2, 1, ["w5"]),
+    cell("c22", 2, 2, ["s1"]),
+    block(
+        "MERGED_CELL",
+        "m1",
+        1,
+        ["c11", "c12"],
+        RowIndex=1,
+        ColumnIndex=1,
+        RowSpan=1,
+        ColumnSpan=2,
+    ),
+    block("PAGE", "p2", 2),
+    word("w6", "Date", 2),
+    word("w7", "today", 2),
+    block("SELECTION_ELEMENT", "s2", 2, SelectionStatus="NOT_SELECTED"),
+    key("k2", ["w6"], "v2", 2),
+    value("v2", ["w7", "s2"], 2),
+    word("w8", "Name:", 2),
+    word("w9", "Jane", 2),
+    key("k3", ["w8"], "v3", 2),
+    value("v3", ["w9"], 2),
+]
+RESPONSE = {"DocumentMetadata": {"Pages": 2}, "Blocks": BLOCKS}
+
+
+def formatter(response=RESPONSE, response_type="analysis"):
+    Aws_ocr = SimpleNamespace(analysis_response=None, text_response=None)
+    setattr(Aws_ocr, f"{response_type}_response", response)
+    return ResponseFormatter(Aws_ocr)
+
+
+def test_pages_text():
+    assert formatter().pages_text == [
+        "Name: John Name: John Item Paid Pen ",
+        "Date today Name: Jane ",
+    ]
+
+
+def test_tables():
+    pages_tables = formatter().pages_tables
+
+    assert [len(tables) for tables in pages_tables] == [1, 0]
+    table = pages_tables[0][0]
+    assert {row: table[row] for row in table} == {
+        1: {1: "Item ", 2: "Paid "},
+        2: {1: "Pen ", 2: "X "},
+    }
+    assert table.merged.tolist() == [[1, 1, 1, 2]]
+    assert table.to_grid().tolist() == [["Item Paid", "Item Paid"], ["Pen ", "X "]]
+
+
+def test_forms():
+    result = formatter()
+
+    assert result.forms == {"Name: ": "Jane ", "Date ": "today "}
+    assert result.pages_forms == [
+        {"Name: ": "John "},
+        {"Date ": "today ", "Name: ": "Jane "},
+    ]
+    assert result.forms_index.get_all("name") == ["John ", "Jane "]
+
+
+def test_text_response_has_no_tables_or_forms():
+    result = formatter(response_type="text")
+
+    assert result.pages_text[1] == "Date today Name: Jane "
+    assert result.pages_tables == [] and result.forms == {}
+
+
+def test_paginated_response_is_the_same():
+    result = formatter(
+        [dict(RESPONSE, Blocks=BLOCKS[:9]), dict(RESPONSE, Blocks=BLOCKS[9:])]
+    )
+    expected = formatter()
+
+    assert result.pages_text == expected.pages_text
+    assert result.pages_forms == expected.pages_forms
+    assert dict(result.pages_tables[0][0]) == dict(expected.pages_tables[0][0])
+
+
+def test_take_renumbers_blocks():
+    store = formatter().store
+    key_id = int(store.ids_of_type("KEY_VALUE_SET")[0])
+    (word_id,) = store.children(key_id)
+    (value_id,) = store.values(key_id)
+
+    taken = store.take([value_id, key_id, word_id], page=7)
+
+    assert len(taken) == 3
+    assert taken.block_type(1) == "KEY_VALUE_SET"
+    assert taken.children(1).tolist() == [2]
+    assert taken.values(1).tolist() == [0]
+    # The child of the value ("John") wasn't taken
+    assert taken.children(0).tolist() == []
+    assert taken.pages.tolist() == [7, 7, 7]
+    assert taken.text(2) == "Name:"
+
+
+def test_compact_page_keeps_its_blocks():
+    page = formatter().pages_response[1]
+
+    compact = page.compact(page=1)
+
+    assert isinstance(compact, BlockList)
+    assert compact.indices.tolist() == list(range(len(page)))
+    assert [b["Text"] for b in compact] == [b["Text"] for b in page]
+    assert {b["Page"] for b in compact} == {1}
+    assert np.array_equal(
+        compact.store.boxes, page.store.boxes[page.indices], equal_nan=True
+    )
+
+
+def test_store_without_blocks():
+    store = BlockStore()
+    store.finalize()
+
+    assert len(store) == 0
+    assert len(store.take([])) == 0
@@ -0,0 +1,119 @@
+import functools
+import os
+
+import pytest
+
+from ocr.cache import ResultCache
+from ocr.engines import register_engine
+from ocr.ocr import Ocr
+from ocr.ocr_document import Document
+from ocr.page_cache import split_pages
+
+source = os.path.join(os.path.dirname(__file__), "test_files", "just-text.pdf")
+
+
+class StubOcr(Document):
+    """Engine that returns the text layer of the pages and records every call."""
+
+    calls = []
+    drop_last_page = False
+
+    def __init__(self, file_path):
+        super().__init__(file_path)
+
+    async def apipeline_extraction(self):
+        self.pages_text = self.pages_text_layer()
+        if self.drop_last_page:
+            self.pages_text = self.pages_text[:-1]
+        self.calls.append(len(self.pages_text))
+        self.text = " ".join(self.pages_text)
+
+
+@pytest.fixture(autouse=True)
+def stub_engine(monkeypatch):
+    monkeypatch.setattr(StubOcr, "calls", [])
+    register_engine("stub", ["text"], f"{__name__}:StubOcr")
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    """Write a pdf with some pages of the source pdf."""
+
+    def write(name, pages):
+        file_path = str(tmp_path / name)
+        Document(source).write_pages(pages, file_path)
+        return file_path
+
+    return write
+
+
+def process(file_path, cache):
+    doc = Ocr(file_path, "text", "stub")
+    doc.set_cache(cache, per_page=True)
+    doc.process_file()
+    return doc
+
+
+@functools.lru_cache()
+def source_text_layer():
+    return Document(source).pages_text_layer()
+
+
+def texts(pages):
+    return [source_text_layer()[page] for page in pages]
+
+
+def test_hit_and_miss(pdf, tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    file_path = pdf("doc.pdf", [0, 1, 2])
+
+    first = process(file_path, cache)
+    second = process(file_path, cache)
+
+    assert StubOcr.calls == [3]
+    assert (cache.misses, cache.hits) == (3, 3)
+    assert first.pages_text == second.pages_text == texts([0, 1, 2])
+    assert second.num_pages == 3
+
+
+def test_only_new_pages_are_processed(pdf, tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    process(pdf("doc.pdf", [0, 1, 2]), cache)
+
+    appended = process(pdf("appended.pdf", [0, 1, 2, 3]), cache)
+    changed = process(pdf("changed.pdf", [0, 5, 2]), cache)
+
+    assert StubOcr.calls == [3, 1, 1]
+    assert appended.pages_text == texts([0, 1, 2, 3])
+    assert changed.pages_text == texts([0, 5, 2])
+
+
+def test_eviction_under_max_size(pdf, tmp_path):
+    file_path = pdf("doc.pdf", [0, 1, 2])
+    process(file_path, ResultCache(str(tmp_path / "sizes")))
+    entry_size = ResultCache(str(tmp_path / "sizes")).size() / 3
+
+    cache = ResultCache(str(tmp_path / "cache"), max_size=int(2.5 * entry_size))
+    process(file_path, cache)
+    assert cache.size() <= cache.max_size
+
+    # The evicted pages are processed again, the rest come from the cache
+    doc = process(file_path, cache)
+    assert 0 < StubOcr.calls[-1] < 3
+    assert doc.pages_text == texts([0, 1, 2])
+
+
+def test_incomplete_results_arent_cached(pdf, tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path / "cache"))
+    monkeypatch.setattr(StubOcr, "drop_last_page", True)
+
+    with pytest.raises(Exception, match="pages_text for 2 pages instead of 3"):
+        process(pdf("doc.pdf", [0, 1, 2]), cache)
+
+    assert cache.size() == 0
+
+
+def test_split_pages_skips_results_that_werent_computed():
+    pages = split_pages({"pages_text": ["a", "b"], "pages_tables": []}, 2)
+
+    assert pages == [{"pages_text": "a"}, {"pages_text": "b"}]